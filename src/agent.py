@@ -1,10 +1,19 @@
 import mesa
-import numpy as np
-from statistics import mean
-from collections import deque
+from ring_buffer import RingBuffer
 
-class EconomicAgent(mesa.Agent):
+class SlottedAgent(mesa.Agent):
+    # mesa.Agent has no __slots__, but once every attribute of a subclass is a slot,
+    # including the ones mesa.Agent sets, the per-instance __dict__ is never created
+    __slots__ = ('unique_id', 'model', 'pos')
+
+class EconomicAgent(SlottedAgent):
     'wealth-maximising agent'
+    __slots__ = ('starting_wealth', 'wealth', 'prosperity', 'trading_skill', 'criminality',
+                 'num_interactions', 'num_crimes_witnessed', 'num_punishments_witnessed', 'num_been_crimed',
+                 'total_trading_gain', 'total_stealing_gain', 'crimes_committed_agent', 'amount_arrested',
+                 'q_incomes', 'q_crime_perception', 'q_interactions', 'has_traded_this_turn',
+                 '_has_committed_crime_this_turn', '_is_arrested', 'time_until_released', 'risk_aversion')
+
     def __init__(self, unique_id, model, trading_skill):
         """
         Initialize an EconomicAgent instance, an EU-maximizing agent within an agent-based model.
@@ -25,9 +34,9 @@ class EconomicAgent(mesa.Agent):
         - total_stealing_gain (float): Cumulative gain from thefts committed.
         - crimes_committed_agent (int): Total number of crimes committed by this agent.
         - amount_arrested (int): Number of times this agent has been arrested.
-        - q_incomes (collections.deque): Queue recording the financial outcomes of recent interactions.
-        - q_crime_perception (collections.deque): Queue recording perceptions of crime and punishment.
-        - q_interactions (collections.deque): Queue recording the types of recent interactions (0 for trade, 1 for theft).
+        - q_incomes (RingBuffer): Queue recording the financial outcomes of recent interactions.
+        - q_crime_perception (RingBuffer): Queue recording perceptions of crime and punishment.
+        - q_interactions (RingBuffer): Queue recording the types of recent interactions (0 for trade, 1 for theft).
         - has_traded_this_turn (bool): Flag indicating if the agent has traded in the current step.
         - has_committed_crime_this_turn (bool): Flag indicating if the agent has committed a crime in the current step.
         - is_arrested (bool): Status flag if the agent is currently arrested.
@@ -42,8 +51,9 @@ class EconomicAgent(mesa.Agent):
         super().__init__(unique_id, model)
         
         #agent's attributes:
-        self.starting_wealth = np.random.uniform(1, 10) #mutable
+        self.starting_wealth = model.streams.attributes.uniform(1, 10) #mutable
         self.wealth = self.starting_wealth
+        model.aggregates.add_agent(self)
         self.prosperity = 1 #fixed
         self.trading_skill = trading_skill
 
@@ -58,39 +68,64 @@ class EconomicAgent(mesa.Agent):
         self.crimes_committed_agent = 0
         self.amount_arrested = 0
 
-        self.q_incomes = deque([0], maxlen=model.interaction_memory) # a queue of incomes from interactions 
-        self.q_crime_perception = deque([], maxlen=model.interaction_memory) # a queue of crimes witnessed, 1 if punished, 0 if not
-        self.q_interactions = deque([], maxlen=model.interaction_memory) # a queue of interactions, 0 if trade, 1 if theft
+        # the queues drop their oldest element once they hold interaction_memory elements
+        self.q_incomes = RingBuffer(model.interaction_memory, [0]) # a queue of incomes from interactions 
+        self.q_crime_perception = RingBuffer(model.interaction_memory) # a queue of crimes witnessed, 1 if punished, 0 if not
+        self.q_interactions = RingBuffer(model.interaction_memory) # a queue of interactions, 0 if trade, 1 if theft
 
         self.has_traded_this_turn = False # only keep true for 1 step of the scheduler
-        self.has_committed_crime_this_turn = False # only keep true for 1 step of the scheduler, allows cops to arrest
-        self.is_arrested = False
+        # backing fields of has_committed_crime_this_turn / is_arrested, which keep the grid index up to date
+        self._has_committed_crime_this_turn = False # only keep true for 1 step of the scheduler, allows cops to arrest
+        self._is_arrested = False
 
         self.time_until_released = 0 # countdown of jail sentence
 
-        risk_av = np.random.normal(1, self.model.risk_aversion_std)
+        risk_av = model.streams.attributes.normal(1, self.model.risk_aversion_std)
         if risk_av <= 0:
             risk_av = 0.1
         self.risk_aversion = risk_av
 
+    def update_crime_perception(self, value):
+        """Add 1 (punished) or 0 (unpunished) to the crime perception queue."""
+        self.q_crime_perception.append(value)
+
+    @property
+    def is_arrested(self):
+        return self._is_arrested
+
+    @is_arrested.setter
+    def is_arrested(self, value):
+        if value == self._is_arrested:
+            return
+        self._is_arrested = value
+        self.model.grid.set_free(self, not value)
+
+    @property
+    def has_committed_crime_this_turn(self):
+        return self._has_committed_crime_this_turn
+
+    @has_committed_crime_this_turn.setter
+    def has_committed_crime_this_turn(self, value):
+        if value == self._has_committed_crime_this_turn:
+            return
+        self._has_committed_crime_this_turn = value
+        self.model.grid.set_criminal(self, value)
+
     def move(self):
         """Move the agent to a random neighboring cell."""
         possible_steps = self.model.grid.get_neighborhood(
             self.pos,
             moore=True,
             include_center=False)
-        new_position = self.random.choice(possible_steps)
+        new_position = self.model.streams.moves.choice(possible_steps)
         self.model.grid.move_agent(self, new_position)
 
     def choose_partner(self):
         """Choose a trading partner from neighboring agents."""
-        cellmates = self.model.grid.get_cell_list_contents([self.pos])
+        cellmates = self.model.grid.free_agents_at(self.pos)
         if len(cellmates) > 1:
-            cellmates = [x for x in cellmates if isinstance(x, EconomicAgent)]
-            cellmates = [x for x in cellmates if not x.is_arrested and not x is self]
-            try:
-                other = self.random.choice(cellmates)
-            except: other = None 
+            cellmates = [x for x in cellmates if not x is self]
+            other = self.model.streams.partners.choice(cellmates)
              # here we can have some wealth prefernces if we want
             return other
         
@@ -112,11 +147,6 @@ class EconomicAgent(mesa.Agent):
             other.q_interactions.append(0)
 
             self.q_incomes.append(trade_value)
-            if len(self.q_incomes) > self.model.interaction_memory:
-                self.q_incomes.pop(0)   
-            # remove the first element of the queue if it's too long
-            if len(other.q_interactions) > other.model.interaction_memory:
-                other.q_interactions.pop(0)
             self.model.total_trade_income += 2*trade_value
                 
     def steal(self, other):
@@ -128,8 +158,6 @@ class EconomicAgent(mesa.Agent):
         self.crimes_committed_agent += 1
 
         self.q_incomes.append(theft_value)
-        if len(self.q_incomes) > self.model.interaction_memory:
-            self.q_incomes.pop(0)   
 
         self.model.total_stolen += theft_value
         self.model.num_crimes_committed += 1
@@ -139,9 +167,6 @@ class EconomicAgent(mesa.Agent):
         self.num_interactions +=1
         other.num_interactions +=1
         other.q_interactions.append(1)
-        # remove the first element of the queue if it's too long
-        if len(other.q_interactions) > other.model.interaction_memory:
-            other.q_interactions.pop(0)
         self.model.num_crimes_committed += 1
         self.model.total_stolen += theft_value
 
@@ -150,13 +175,13 @@ class EconomicAgent(mesa.Agent):
         # TODO calculations of expected value to determine action
         if len(self.q_crime_perception) > 0:
             # use self.q_crime_perception to calculate arrest chance
-            arrest_chance = sum(self.q_crime_perception)/len(self.q_crime_perception)
+            arrest_chance = self.q_crime_perception.mean()
         else: arrest_chance = 0
 
         alpha = -1.2 # shape parameter for the pareto distribution
         sp = 1 # scale parameter for the pareto distribution
         transformed_sentence_length = sp / (self.model.sentence_length ** (1 / alpha))
-        expected_punishment_pain = self.wealth + self.risk_aversion * (transformed_sentence_length * mean(self.q_incomes))
+        expected_punishment_pain = self.wealth + self.risk_aversion * (transformed_sentence_length * self.q_incomes.mean())
 
         theft_EU = other.wealth/2 - expected_punishment_pain*arrest_chance
         trade_EU = (other.wealth + self.wealth)* self.model.prosperity * self.trading_skill
@@ -169,7 +194,7 @@ class EconomicAgent(mesa.Agent):
     def vote(self):
         """Vote to increase or decrease the tax rate based on crime threat and tax burden."""
         if len(self.q_interactions) >0:
-            crime_rate = sum(self.q_interactions)/self.model.interaction_memory
+            crime_rate = self.q_interactions.sum()/self.model.interaction_memory
         else: crime_rate = 0
         theft_threat = crime_rate* self.wealth* self.risk_aversion * 0.5 #TODO this is hard coded at .5     
         tax_burden = self.wealth*self.model.tax_rate
@@ -185,16 +210,10 @@ class EconomicAgent(mesa.Agent):
 
     def check_for_crimes(self):
         """Check for crimes in the neighborhood."""
-        neighbors = self.model.grid.get_neighbors(
-            self.pos,
-            moore=True,
-            include_center=True,
-            radius=1  # Vision radius
-        )
-        for neighbor in neighbors:
-            if isinstance(neighbor, EconomicAgent) and neighbor.has_committed_crime_this_turn:
-                self.q_crime_perception.append(0)
-                self.num_crimes_witnessed += 1
+        crimes_seen = self.model.grid.count_crimes_near(self.pos)
+        if crimes_seen > 0:
+            self.q_crime_perception.extend([0] * crimes_seen)
+            self.num_crimes_witnessed += crimes_seen
 
     def step(self):
         """Perform a single step of the agent's behavior."""
@@ -220,8 +239,20 @@ class EconomicAgent(mesa.Agent):
             vote = self.vote() #returns +/- 1
             self.model.votes += vote
 
-class CopAgent(mesa.Agent):
+    def serve_sentence(self):
+        """Take the place of step() while the agent is parked in the model's jail calendar."""
+        self.has_traded_this_turn = False
+        self.time_until_released -=1
+        self.pay_tax()
+
+        if (self.model.steps)%self.model.election_frequency == 0:
+            vote = self.vote() #returns +/- 1
+            self.model.votes += vote
+
+class CopAgent(SlottedAgent):
     'crime-fighting agent'
+    __slots__ = ()
+
     def __init__(self, unique_id, model):
         super().__init__(unique_id, model)
 
@@ -231,20 +262,13 @@ class CopAgent(mesa.Agent):
             self.pos,
             moore=True,
             include_center=True)
-        new_position = self.random.choice(possible_steps)
+        new_position = self.model.streams.moves.choice(possible_steps)
         self.model.grid.move_agent(self, new_position)
         
     def look_for_crimes(self):
         """Look for crimes in the neighborhood and arrest criminals."""
-        neighbors = self.model.grid.get_neighbors(
-            self.pos,
-            moore=True,
-            include_center=True,
-            radius=1  # Vision radius
-        )
-        for neighbor in neighbors:
-            if isinstance(neighbor, EconomicAgent) and neighbor.has_committed_crime_this_turn:
-                self.arrest(neighbor)
+        for criminal in self.model.grid.criminals_near(self.pos):
+            self.arrest(criminal)
 
     def arrest(self, criminal_agent):
         """Arrest a criminal agent and update relevant attributes."""
@@ -255,20 +279,11 @@ class CopAgent(mesa.Agent):
         # the idea is that once they're arrested and in jail, people are no longer observing the crime being committed
         criminal_agent.has_committed_crime_this_turn = False
         self.model.num_arrests_made += 1
+        self.model.schedule.note_arrest(criminal_agent)
 
         # make the arrest announcement
-        neighbors = self.model.grid.get_neighbors(
-            self.pos,
-            moore=True,
-            include_center=True,
-            radius=1  # Vision radius
-        )
-        for neighbor in neighbors:
-            if isinstance(neighbor, EconomicAgent):
-                neighbor.q_crime_perception.append(1)
-                # remove the first element of the queue if it's too long
-                if len(neighbor.q_crime_perception) > neighbor.model.interaction_memory:
-                    neighbor.q_crime_perception.pop(0)
+        for neighbor in self.model.grid.economic_agents_near(self.pos):
+            neighbor.update_crime_perception(1)
 
     def step(self):
         self.move()
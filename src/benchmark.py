@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import toml
+from joblib import cpu_count
+
+BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'baseline.json')
+
+# model cases: every number of agents on every grid size, then the cops and sentence lengths at the default size
+CASES = ([{'num_econ_agents': agents, 'width': size, 'height': size, 'initial_cops': 2, 'sentence_length': 20}
+          for agents, size in itertools.product([100, 200, 300, 1000], [20, 40, 80])] +
+         [{'num_econ_agents': 200, 'width': 20, 'height': 20, 'initial_cops': cops, 'sentence_length': sentence}
+          for cops, sentence in [(20, 20), (60, 20), (2, 5), (2, 90), (20, 90)]])
+
+# metric -> True if higher is better, checked against the baseline (agent_steps_per_sec moves with steps_per_sec);
+# construct_seconds is reported but not checked, even its median over many constructions varies by a third
+# between runs on a busy machine
+METRICS = {'steps_per_sec': True, 'peak_rss_mb': False, 'runs_per_sec': True}
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+def time_model(params, steps=100, repeats=3, seed=0, construct_repeats=50):
+    """
+    Time EconomicModel steps for one parameter set, best of repeats, and its construction, median of
+    construct_repeats: a construction takes about a millisecond, too short to compare a single timing.
+
+    Returns:
+    - dict: params, construct_seconds, steps_per_sec, agent_steps_per_sec and the peak RSS of the process in MB.
+    """
+    from model import EconomicModel
+    constructs = []
+    for repeat in range(construct_repeats):
+        start = time.perf_counter()
+        EconomicModel(**params, seed=seed + repeat)
+        constructs.append(time.perf_counter() - start)
+    step = float('inf')
+    for repeat in range(repeats):
+        model = EconomicModel(**params, seed=seed + repeat)
+        start = time.perf_counter()
+        for _ in range(steps):
+            model.step()
+        step = min(step, time.perf_counter() - start)
+    return {**params, 'construct_seconds': statistics.median(constructs), 'steps_per_sec': steps / step,
+            'agent_steps_per_sec': steps * params['num_econ_agents'] / step, 'peak_rss_mb': _peak_rss_mb()}
+
+def bench_models(cases=CASES, steps=100, repeats=3):
+    """time_model for every case, each in a fresh process so peak RSS belongs to that case alone."""
+    results = []
+    for params in cases:
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            result = executor.submit(time_model, params, steps, repeats).result()
+        print(f"{params}: {result['steps_per_sec']:.1f} steps/s, {result['agent_steps_per_sec']:.0f} agent-steps/s, "
+              f"{result['peak_rss_mb']:.0f} MB")
+        results.append(result)
+    return results
+
+def bench_sweep(n_jobs_list, num_samples=4, num_iterations=4, max_steps=100, config_path='config.toml'):
+    """
+    End-to-end throughput of experiment.run at every n_jobs, in a temporary directory without a run cache.
+
+    Returns:
+    - list: n_jobs, runs, seconds, runs_per_sec and parallel efficiency (runs_per_sec relative to n_jobs times
+      that of the first entry, normally n_jobs = 1) per entry.
+    """
+    import experiment
+    config = toml.load(config_path)
+    config['simulation'].update(num_samples=num_samples, num_iterations=num_iterations, max_steps=max_steps, save_agent_data=False,
+                                output_format='shards', cache_dir='', profile=False)
+    config.pop('adaptive', None)
+    config.pop('queue', None)
+    runs = num_samples * num_iterations
+    results = []
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp()
+    try:
+        os.chdir(directory)
+        for n_jobs in n_jobs_list:
+            config['simulation']['n_jobs'] = n_jobs
+            with open('config.toml', 'w') as f:
+                toml.dump(config, f)
+            start = time.perf_counter()
+            experiment.run('config.toml', 'tax_per_cop')
+            seconds = time.perf_counter() - start
+            results.append({'n_jobs': n_jobs, 'runs': runs, 'seconds': seconds, 'runs_per_sec': runs / seconds})
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+    for result in results:
+        result['efficiency'] = result['runs_per_sec'] / (result['n_jobs'] * results[0]['runs_per_sec'] / results[0]['n_jobs'])
+        print(f"n_jobs={result['n_jobs']}: {result['runs_per_sec']:.2f} runs/s, parallel efficiency {result['efficiency']:.2f}")
+    return results
+
+def _key(entry):
+    return json.dumps({key: value for key, value in entry.items() if key in ('num_econ_agents', 'width', 'height', 'initial_cops', 'sentence_length', 'n_jobs')},
+                      sort_keys=True)
+
+def compare(report, baseline, tolerance=0.3):
+    """
+    Regressions of report against baseline: metrics that are more than tolerance (a fraction) worse.
+
+    Returns:
+    - list: One message per regression, empty if there is none.
+    """
+    regressions = []
+    for section in ('models', 'sweep'):
+        previous = {_key(entry): entry for entry in baseline.get(section, [])}
+        for entry in report.get(section, []):
+            old = previous.get(_key(entry))
+            if old is None:
+                continue
+            for metric, higher_is_better in METRICS.items():
+                if metric not in entry or metric not in old:
+                    continue
+                ratio = entry[metric] / old[metric] if old[metric] else 1.0
+                if (ratio < 1 - tolerance) if higher_is_better else (ratio > 1 + tolerance):
+                    regressions.append(f"{section} {_key(entry)}: {metric} {old[metric]:.4g} -> {entry[metric]:.4g}")
+    return regressions
+
+def _processor():
+    # platform.processor() is empty on most Linux systems, the CPU model is in /proc/cpuinfo there
+    if platform.processor():
+        return platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.machine()
+
+def machine():
+    """The machine a report was measured on, stored in the baseline: timings only compare on the same machine."""
+    return {'platform': platform.platform(), 'processor': _processor(), 'python': platform.python_version(), 'cpus': cpu_count()}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark model steps and experiment sweeps, and check them against the baseline:")
+    parser.add_argument('-c', '--config', type=str, default='config.toml', help='Configuration file of the sweep benchmark.')
+    parser.add_argument('--steps', type=int, default=100, help='Steps per model case.')
+    parser.add_argument('--repeats', type=int, default=3, help='Repeats per model case, the best is kept.')
+    parser.add_argument('--n-jobs', type=int, nargs='+', help='n_jobs values of the sweep benchmark, by default 1, 2, 4, ... up to the CPU count.')
+    parser.add_argument('--skip-sweep', action='store_true', help='Only benchmark the model.')
+    parser.add_argument('--baseline', type=str, default=BASELINE, help='Baseline file.')
+    # timings of a busy machine easily vary by 20%
+    parser.add_argument('--tolerance', type=float, default=0.3, help='Allowed fraction a metric may be worse than its baseline.')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the baseline instead of checking it.')
+    parser.add_argument('-o', '--output', type=str, help='Also write the report to this JSON file.')
+
+    args = parser.parse_args()
+    n_jobs_list = args.n_jobs or [2 ** k for k in range(cpu_count().bit_length()) if 2 ** k <= cpu_count()]
+    report = {'machine': machine(), 'steps': args.steps, 'models': bench_models(CASES, args.steps, args.repeats),
+              'sweep': [] if args.skip_sweep else bench_sweep(n_jobs_list, config_path=args.config)}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('machine') != report['machine']:
+            print("Warning: the baseline was measured on another machine, rerun with --save-baseline there first")
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
+    else:
+        print(f"No baseline at {args.baseline}, rerun with --save-baseline to create it")
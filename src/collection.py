@@ -0,0 +1,114 @@
+import types
+from collections import deque
+from functools import partial
+import mesa
+import pandas as pd
+
+class CollectionPolicy:
+    """
+    When a DataCollector records and how many of its records it keeps.
+
+    Policies are written as strings, e.g. in config.toml [simulation]:
+    - "every": record every step and keep everything (mesa's default).
+    - "every:k": record every k-th step (steps k, 2k, ...) and keep everything.
+    - "final": keep only the most recent step, i.e. the final one once the run is over.
+    - "window:n": keep the most recent n steps.
+    - "never": record nothing.
+
+    "final", "window:n" and "never" bound the memory of a run regardless of the number of steps.
+
+    Parameters:
+    - every (int): Record every `every`-th collect call, 0 records nothing.
+    - keep (int or None): Number of records kept, None keeps all of them.
+    """
+    def __init__(self, every=1, keep=None):
+        if every < 0 or (keep is not None and keep < 0):
+            raise ValueError("every and keep must not be negative")
+        self.every = every
+        self.keep = keep
+
+    @classmethod
+    def parse(cls, spec):
+        """Build a policy from a string like "every:10", or return spec if it already is a policy."""
+        if isinstance(spec, CollectionPolicy):
+            return spec
+        mode, _, value = str(spec).partition(':')
+        if mode == 'every':
+            return cls(every=int(value) if value else 1)
+        if mode == 'final' and not value:
+            return cls(keep=1)
+        if mode == 'window' and value:
+            return cls(keep=int(value))
+        if mode == 'never' and not value:
+            return cls(every=0, keep=0)
+        raise ValueError(f"unknown collection policy {spec!r}, use every, every:k, final, window:n or never")
+
+    def due(self, collection):
+        """Whether the collection-th call (counting from 1) is recorded."""
+        return self.every > 0 and collection % self.every == 0
+
+    def __repr__(self):
+        return f"CollectionPolicy(every={self.every}, keep={self.keep})"
+
+def report(reporter, model):
+    """Evaluate a model reporter the way mesa.DataCollector does."""
+    if isinstance(reporter, (types.LambdaType, partial)):
+        return reporter(model)
+    if isinstance(reporter, str):
+        return getattr(model, reporter, None)
+    if isinstance(reporter, list):
+        return reporter[0](*reporter[1])
+    return reporter()
+
+class PolicyDataCollector(mesa.DataCollector):
+    """
+    mesa.DataCollector that records model and agent reporters according to separate CollectionPolicies.
+
+    Model variables are kept in deques bounded by the model policy and agent records are dropped oldest
+    first beyond the agent policy's limit. The DataFrames keep mesa's layout, with the 'Step' model
+    reporter and the agent index telling which steps were recorded.
+
+    Parameters:
+    - model_reporters (dict): As for mesa.DataCollector.
+    - agent_reporters (dict): As for mesa.DataCollector.
+    - model_policy (str or CollectionPolicy): Policy for the model reporters.
+    - agent_policy (str or CollectionPolicy): Policy for the agent reporters.
+    """
+    def __init__(self, model_reporters=None, agent_reporters=None, model_policy='every', agent_policy='every'):
+        super().__init__(model_reporters=model_reporters, agent_reporters=agent_reporters)
+        self._agent_reporter_specs = dict(agent_reporters or {})
+        self.model_policy = CollectionPolicy.parse(model_policy)
+        self.agent_policy = CollectionPolicy.parse(agent_policy)
+        self.model_vars = {var: deque(maxlen=self.model_policy.keep) for var in self.model_vars}
+        self._collections = 0
+
+    def __getstate__(self):
+        # mesa wraps attribute name reporters in local functions, which cannot be pickled
+        state = self.__dict__.copy()
+        del state['agent_reporters']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.agent_reporters = {}
+        for name, reporter in self._agent_reporter_specs.items():
+            self._new_agent_reporter(name, reporter)
+
+    def collect(self, model):
+        self._collections += 1
+        if self.model_reporters and self.model_policy.due(self._collections):
+            for var, reporter in self.model_reporters.items():
+                self.model_vars[var].append(report(reporter, model))
+
+        if self.agent_reporters and self.agent_policy.due(self._collections):
+            self._agent_records[model._steps] = list(self._record_agents(model))
+            keep = self.agent_policy.keep
+            while keep is not None and len(self._agent_records) > keep:
+                del self._agent_records[next(iter(self._agent_records))]
+
+    def get_agent_vars_dataframe(self):
+        if self.agent_reporters and not self._agent_records:
+            # mesa mangles the frame when there are no records at all, e.g. with the "never" policy
+            index = pd.MultiIndex.from_arrays([[], []], names=["Step", "AgentID"])
+            return pd.DataFrame(columns=list(self.agent_reporters), index=index)
+        return super().get_agent_vars_dataframe()
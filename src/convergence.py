@@ -0,0 +1,123 @@
+from collections import deque
+import numpy as np
+
+# outputs watched by ConvergenceMonitor; crimes are watched per step since num_crimes_committed only grows
+MONITORED = ['crimes_per_step', 'num_cops', 'gini_coeff']
+
+# model reporters that only grow, extrapolated from their steady-state rate for runs that stopped early
+CUMULATIVE = ['num_crimes_committed', 'num_arrests_made']
+
+def _gini(model):
+    # EconomicModel keeps its wealth in an AggregateTracker, the array models have their own gini
+    if hasattr(model, 'aggregates'):
+        return model.aggregates.gini(model.num_agents)
+    return model.gini()
+
+def is_stationary(values, tolerance):
+    """
+    Windowed slope test: whether a series shows no trend.
+
+    A line is fitted through the values, and the series counts as stationary when the drift of that
+    line over the window is at most tolerance times the scale of the series (the larger of the absolute
+    mean and the standard deviation), so it works for noisy series and for series near zero alike.
+    """
+    values = np.asarray(values, dtype=float)
+    t = np.arange(values.size)
+    slope = np.polyfit(t, values, 1)[0]
+    drift = abs(slope) * (values.size - 1)
+    scale = max(abs(values.mean()), values.std(), 1e-12)
+    return drift <= tolerance * scale
+
+class ConvergenceMonitor:
+    """
+    Online steady-state detection for one model run.
+
+    After every step update reads the crimes committed this step, the number of cops and the Gini
+    coefficient of the model. Every check_every steps (by default every election cycle) the last
+    `window` values of each are tested with is_stationary; once all three pass `patience` checks in a
+    row the run is stationary, update returns True and the run can stop. stop_step and converged
+    record what happened, and rates() gives the steady-state growth per step of the CUMULATIVE reporters
+    so their final values can be extrapolated.
+
+    Parameters:
+    - window (int): Number of steps tested.
+    - tolerance (float): Allowed drift over the window relative to the scale of the series.
+    - patience (int): Number of consecutive passing checks needed.
+    - check_every (int or None): Steps between checks, None uses the model's election_frequency.
+    - min_steps (int): Never stop before this step.
+    """
+    def __init__(self, window=100, tolerance=0.05, patience=2, check_every=None, min_steps=0):
+        if window < 3:
+            raise ValueError("window must be at least 3 steps")
+        self.window = window
+        self.tolerance = tolerance
+        self.patience = patience
+        self.check_every = check_every
+        self.min_steps = min_steps
+        self.converged = False
+        self.stop_step = None
+        self._cumulative = {name: deque(maxlen=window + 1) for name in CUMULATIVE} # differenced when checked
+        self._series = {name: deque(maxlen=window) for name in MONITORED[1:]}
+        self._passed = 0
+
+    @classmethod
+    def from_config(cls, settings):
+        """Monitor from a config.toml [convergence] table, None if it is missing or not enabled."""
+        if not settings or not settings.get('enabled', False):
+            return None
+        return cls(**{key: value for key, value in settings.items() if key != 'enabled'})
+
+    def settings(self):
+        """The parameters of the monitor, e.g. for cache keys."""
+        return {'window': self.window, 'tolerance': self.tolerance, 'patience': self.patience,
+                'check_every': self.check_every, 'min_steps': self.min_steps}
+
+    def update(self, model):
+        """Record the current step of model, returns True once the run is stationary."""
+        for name, values in self._cumulative.items():
+            values.append(getattr(model, name))
+        self._series['num_cops'].append(model.num_cops)
+        self._series['gini_coeff'].append(_gini(model))
+
+        step = model.steps
+        check_every = self.check_every or model.election_frequency
+        crimes = self._cumulative['num_crimes_committed']
+        if step % check_every or step < self.min_steps or len(crimes) <= self.window:
+            return False
+
+        series = [np.diff(crimes), *self._series.values()]
+        if all(is_stationary(values, self.tolerance) for values in series):
+            self._passed += 1
+        else:
+            self._passed = 0
+        if self._passed >= self.patience:
+            self.converged = True
+            self.stop_step = step
+        return self.converged
+
+    def rates(self):
+        """Mean growth per step of the CUMULATIVE reporters over the last window."""
+        return {name: (values[-1] - values[0]) / (len(values) - 1) if len(values) > 1 else 0.0
+                for name, values in self._cumulative.items()}
+
+def extrapolate_final(rows, last_step_num):
+    """
+    Extrapolate the final rows of runs that stopped early to last_step_num.
+
+    The CUMULATIVE reporters of each row grow at their steady-state rate (the <column>_per_step columns
+    written for runs with convergence enabled) for the steps the run did not take. Rows without rate
+    columns are returned unchanged.
+
+    Parameters:
+    - rows (pd.DataFrame): One row per run, its last recorded step.
+    - last_step_num (int): The step to extrapolate to.
+
+    Returns:
+    - pd.DataFrame: A copy of rows with the cumulative reporters extrapolated.
+    """
+    rows = rows.copy()
+    remaining = last_step_num - rows['Step']
+    for name in CUMULATIVE:
+        if name + '_per_step' in rows:
+            rows[name] += rows[name + '_per_step'] * remaining
+    return rows
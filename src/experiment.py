@@ -2,29 +2,158 @@ import argparse
 import toml
 import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
+from scipy import stats
+from joblib import Parallel, delayed, cpu_count
 import mesa
 from model import EconomicModel
 from agent import EconomicAgent, CopAgent
+from rng import run_seed
+from results_io import ShardSink, RunSink, load_results
+from run_cache import RunCache, run_model, config_id, split_duplicates
+from convergence import extrapolate_final
+from task_queue import task_queue
+from profiler import summarize
+from snapshot import FORKABLE, burn_in_all
 
-def run_simulation(params, max_steps, iteration, save_agent_data, total_iterations):
+def run_simulation(params, max_steps, iteration, save_agent_data, total_iterations, seed=None, use_kernel=False, collect_model='every', collect_agents='every', sinks=None, run_id=None, cache=None, convergence=None, profile=None, start=None):
     print(f"Running iteration {iteration + 1}/{total_iterations}, with parameters: {params}")
-    model = EconomicModel(**params)
-    for i in range(max_steps):
-        model.step()
+    model_results, agent_results, info = run_model(params, max_steps, seed, cache, use_kernel, collect_model,
+                                                   collect_agents if save_agent_data else 'never', convergence, profile is not None,
+                                                   start)
+    if profile is not None:
+        # one profile table per run, written by the worker and summed up in run
+        profile.write(info.pop('profile').assign(run_id=run_id), f'{run_id:08d}')
 
-    model_results = model.datacollector.get_model_vars_dataframe()
-    model_results["iteration"] = iteration + 1
-    for key, value in params.items():
-        model_results[key] = value
+    model_sink, agent_sink = sinks if sinks is not None else (None, None)
+    if isinstance(model_sink, RunSink):
+        # the parameters go to the runs table once instead of into every row
+        model_sink.write(model_results, run_id, params, iteration=iteration + 1, seed=seed, **info)
+    else:
+        model_results["iteration"] = iteration + 1
+        for key, value in params.items():
+            model_results[key] = value
+        # mark the runs that stopped early at a steady state
+        for key, value in info.items():
+            if key != 'wall_time':
+                model_results[key] = value
 
-    agent_results = None
-    if save_agent_data:
-        agent_results = model.datacollector.get_agent_vars_dataframe()
+    if not save_agent_data:
+        agent_results = None
+    else:
         agent_results["iteration"] = iteration + 1
+        if isinstance(model_sink, RunSink):
+            agent_results["run_id"] = run_id
+
+    if sinks is not None:
+        # write the results from the worker so they are never gathered in memory
+        shard = f'{run_id:08d}'
+        if isinstance(model_sink, ShardSink):
+            model_sink.write(model_results, shard)
+        if agent_sink is not None:
+            agent_sink.write(agent_results.reset_index(), shard)
     
     return model_results, agent_results
 
+def run_batch(tasks, max_steps, save_agent_data, total_iterations, use_kernel=False, collect_model='every', collect_agents='every', sinks=None, cache=None, convergence=None,
+              profile=None):
+    """
+    Run a chunk of (p, params, iteration, seed) tasks one after the other in one worker. Tasks can have the
+    path of a burned-in snapshot to fork from as a fifth element.
+
+    The results go back as NumPy record arrays, which are much cheaper to send to the parent than DataFrames,
+    or not at all if they were written to sinks. The last row of the model results always goes back, as None
+    when the collection policy recorded nothing ("never").
+
+    Returns:
+    - list: (p, iteration, model records, agent records, last model row as a dict) per task.
+    """
+    results = []
+    for p, params, i, seed, *start in tasks:
+        model_results, agent_results = run_simulation(params, max_steps, i, save_agent_data, total_iterations, seed, use_kernel, collect_model, collect_agents,
+                                                      sinks, p * total_iterations + i, cache, convergence, profile, start[0] if start else None)
+        last = model_results.iloc[-1].to_dict() if len(model_results) else None
+        if sinks is not None:
+            model_results, agent_results = None, None
+        results.append((p, i, _records(model_results), _records(agent_results), last))
+    return results
+
+def _records(df):
+    return None if df is None else df.to_records(index=False)
+
+def batches_of(tasks, batch_size, n_jobs=-1):
+    """Split tasks into chunks of batch_size, "auto" gives every one of n_jobs workers about four chunks."""
+    if batch_size == 'auto':
+        batch_size = -(-len(tasks) // (4 * (cpu_count() if n_jobs < 0 else n_jobs)))
+    batch_size = max(1, int(batch_size))
+    return [tasks[start:start + batch_size] for start in range(0, len(tasks), batch_size)]
+
+def run_tasks(tasks, batch_size, dedup, *args, queue=None, n_jobs=-1):
+    """
+    Run (p, params, iteration, seed) tasks in parallel, as run_batch(batch, *args) calls on batches of batch_size.
+
+    With dedup, duplicate configurations run after all unique ones, so they are read from the run cache
+    instead of being simulated again. With a task_queue.TaskQueue the batches run on its workers, otherwise
+    with joblib on n_jobs processes of this machine.
+
+    Returns:
+    - dict: (p, iteration) -> (model records, agent records, last model row) of every task.
+    """
+    phases = split_duplicates(tasks, lambda task: (config_id(task[1]), task[3])) if dedup else [tasks]
+    results = {}
+    for phase in phases:
+        if queue is not None:
+            outputs = queue.map(run_batch, [(batch, *args) for batch in batches_of(phase, batch_size)])
+        else:
+            outputs = Parallel(n_jobs=n_jobs)(delayed(run_batch)(batch, *args) for batch in batches_of(phase, batch_size, n_jobs))
+        for batch_results in outputs:
+            for p, i, *result in batch_results:
+                results[p, i] = result
+    return results
+
+def ci_half_width(values, confidence=0.95):
+    """Half-width of the Student t confidence interval of the mean of values, inf for fewer than 2 values."""
+    values = np.asarray(values, dtype=float)
+    if values.size < 2:
+        return np.inf
+    return stats.t.ppf((1 + confidence) / 2, values.size - 1) * values.std(ddof=1) / np.sqrt(values.size)
+
+def relative_ci_widths(last_rows, outputs, max_steps, confidence=0.95):
+    """
+    The widest CI half-width, relative to the mean, over the final-step outputs of one parameter value.
+
+    Parameters:
+    - last_rows (list): The last model row (dict) of every run of the parameter value.
+    - outputs (list): Model reporters to look at.
+    - max_steps (int): The final step, runs stopped early by the convergence monitor are extrapolated to it.
+    - confidence (float): Confidence level of the intervals.
+
+    Returns:
+    - float: max over outputs of half-width / |mean|, 0 for outputs that are constant.
+    """
+    final = extrapolate_final(pd.DataFrame(last_rows), max_steps)
+    widths = []
+    for output in outputs:
+        half_width = ci_half_width(final[output], confidence)
+        widths.append(0.0 if half_width == 0 else half_width / max(abs(final[output].mean()), 1e-12))
+    return max(widths)
+
+def allocate_round(widths, counts, target, round_size, max_iterations, budget):
+    """
+    Parameter values that get another round of replicates: those whose CI is still wider than target, widest
+    first, as long as they stay under max_iterations and the rounds fit in the remaining budget of runs.
+
+    Returns:
+    - dict: p -> number of replicates to add.
+    """
+    allocation = {}
+    for p in sorted(widths, key=widths.get, reverse=True):
+        extra = min(round_size, max_iterations - counts[p], budget)
+        if widths[p] <= target or extra <= 0:
+            continue
+        allocation[p] = extra
+        budget -= extra
+    return allocation
+
 def generate_params(bounds, num_samples, vary_param, default_params):
     params_list = []
     if vary_param:
@@ -50,21 +179,101 @@ def run(config_path, vary_param=None):
     num_iterations = sim_settings['num_iterations']
     max_steps = sim_settings['max_steps']
     save_agent_data = sim_settings['save_agent_data']
+    seed = sim_settings.get('seed')
+    use_kernel = sim_settings.get('jit_kernel', False)
+    collect_model = sim_settings.get('collect_model', 'every')
+    collect_agents = sim_settings.get('collect_agents', 'every')
+    output_format = sim_settings.get('output_format', 'csv')
+    cache_dir = sim_settings.get('cache_dir', '')
+    cache_max_mb = sim_settings.get('cache_max_mb')
+    batch_size = sim_settings.get('batch_size', 'auto')
+    n_jobs = sim_settings.get('n_jobs', -1)
+    burn_in = sim_settings.get('burn_in', 0)
+    convergence = config.get('convergence')
+    adaptive = config.get('adaptive', {})
+    if adaptive.get('enabled', False) and collect_model == 'never':
+        raise ValueError('[adaptive] needs the final step of every run, use another collect_model than "never"')
+    queue = task_queue(config.get('queue'))
+    profile = ShardSink('results/profile') if sim_settings.get('profile', False) else None
+    if profile is not None:
+        profile.clear()
 
     params_list = generate_params(bounds, num_samples, vary_param, default_params)
 
-    results = Parallel(n_jobs=-1)(
-        delayed(run_simulation)(params, max_steps, i, save_agent_data, num_iterations)
-        for params in params_list
-        for i in range(num_iterations)
-    )
+    sinks = None
+    if output_format in ('shards', 'normalized'):
+        model_sink = ShardSink('results/model_results') if output_format == 'shards' else RunSink('results/model_runs')
+        sinks = (model_sink, ShardSink('results/agent_results') if save_agent_data else None)
+        for sink in sinks:
+            if sink is not None:
+                sink.clear()
+
+    cache = None
+    if cache_dir:
+        cache = RunCache(cache_dir, None if cache_max_mb is None else int(cache_max_mb * 2**20))
+
+    dedup = cache is not None and seed is not None
+    warm = burn_in > 0 and vary_param in FORKABLE and seed is not None
+    if burn_in > 0 and not warm:
+        print(f"No warm start: it needs a seed and one of {FORKABLE} as the varied parameter")
+    starts = {}
+    def burn_in_iterations(iterations):
+        # every iteration is burned in once with the default parameters
+        missing = [i for i in iterations if i not in starts]
+        paths = burn_in_all(default_params, min(burn_in, max_steps), [run_seed(seed, config_id(default_params), i) for i in missing], 'results/burn_in',
+                            n_jobs, use_kernel, collect_model, collect_agents if save_agent_data else 'never')
+        starts.update(zip(missing, paths))
+
+    # seeds follow the configuration rather than its position, so duplicate configurations are the same run
+    def task(p, i):
+        if warm:
+            # all parameter values of an iteration fork from its burn-in, so they share its random numbers
+            return (p, params_list[p], i, run_seed(seed, config_id(default_params), i), starts[i])
+        return (p, params_list[p], i, run_seed(seed, config_id(params_list[p]), i))
+
+    if not adaptive.get('enabled', False):
+        if warm:
+            burn_in_iterations(range(num_iterations))
+        results = run_tasks([task(p, i) for p in range(len(params_list)) for i in range(num_iterations)], batch_size, dedup,
+                            max_steps, save_agent_data, num_iterations, use_kernel, collect_model, collect_agents, sinks, cache, convergence, profile, queue=queue, n_jobs=n_jobs)
+    else:
+        # rounds of replicates go only to the parameter values whose final-step outputs are still too uncertain
+        outputs = adaptive.get('outputs', ['num_crimes_committed', 'gini_coeff'])
+        target = adaptive.get('target_ci', 0.05)
+        confidence = adaptive.get('confidence', 0.95)
+        round_size = adaptive.get('round_size', 5)
+        max_iterations = adaptive.get('max_iterations', 4 * num_iterations)
+        budget = adaptive.get('budget', len(params_list) * num_iterations)
+        allocation = dict.fromkeys(range(len(params_list)), min(adaptive.get('min_iterations', 5), max_iterations))
+        counts = dict.fromkeys(allocation, 0)
+        results = {}
+        while allocation:
+            if warm:
+                burn_in_iterations(range(max(counts[p] + extra for p, extra in allocation.items())))
+            tasks = [task(p, i) for p, extra in allocation.items() for i in range(counts[p], counts[p] + extra)]
+            results.update(run_tasks(tasks, batch_size, dedup, max_steps, save_agent_data, max_iterations, use_kernel, collect_model, collect_agents,
+                                     sinks, cache, convergence, profile, queue=queue, n_jobs=n_jobs))
+            budget -= len(tasks)
+            for p, extra in allocation.items():
+                counts[p] += extra
+            widths = {p: relative_ci_widths([results[p, i][2] for i in range(counts[p])], outputs, max_steps, confidence) for p in counts}
+            allocation = allocate_round(widths, counts, target, round_size, max_iterations, budget)
+            print(f"Adaptive round: {sum(counts.values())} runs, relative CI widths {[round(w, 3) for w in widths.values()]}, next round {allocation}")
+    if profile is not None:
+        summary = summarize(load_results(profile.path))
+        summary.to_csv('results/profile_summary.csv', index=False)
+        print(summary.to_string(index=False))
+
+    if sinks is not None:
+        return
+    results = [results[key] for key in sorted(results)]
 
-    model_results = [model_df for model_df, _ in results]
+    model_results = [pd.DataFrame(model_records) for model_records, _, _ in results]
     model_results_df = pd.concat(model_results, ignore_index=True)
     model_results_df.to_csv('results/model_results.csv', index=False)
     
     if save_agent_data:
-        agent_results = [agent_df for _, agent_df in results if agent_df is not None]
+        agent_results = [pd.DataFrame(agent_records) for _, agent_records, _ in results if agent_records is not None]
         agent_results_df = pd.concat(agent_results, ignore_index=True)
         agent_results_df.to_csv('results/agent_results.csv', index=False)
 
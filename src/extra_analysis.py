@@ -4,6 +4,9 @@ import mesa
 from model import EconomicModel, compute_gini
 from agent import EconomicAgent, CopAgent
 import matplotlib.pyplot as plt
+from sweep import sweep, summarize
+from run_cache import RunCache
+import toml
 
 def trading_skill_tests():
     #Seeing if trading skill impacts total amount made by trading and if lower trading skill results in more stealing
@@ -16,7 +19,9 @@ def trading_skill_tests():
             sentence_length=15,
             interaction_memory=20,
             risk_aversion_std=0.1,
-            trading_skill_std= 0.3
+            trading_skill_std= 0.3,
+            collect_model='final',
+            collect_agents='final'
         )
 
     for step in range(1000):
@@ -70,7 +75,9 @@ def starting_wealth():
             sentence_length=15,
             interaction_memory=20,
             risk_aversion_std=0.1,
-            trading_skill_std= 0.1
+            trading_skill_std= 0.1,
+            collect_model='final',
+            collect_agents='final'
         )
 
         for step in range(1000):
@@ -99,7 +106,9 @@ def risk_check():
         sentence_length=15,
         interaction_memory=20,
         risk_aversion_std=0.3,
-        trading_skill_std= 0.1
+        trading_skill_std= 0.1,
+        collect_model='final',
+        collect_agents='final'
     )
      
     for step in range(1000):
@@ -116,436 +125,107 @@ def risk_check():
     plt.ylabel('amount_arrested')
     plt.savefig('src/extra_graphs/Risk aversion vs times arrested.png')
 
-# def memory_vs_election():
-    
-#     results = []
-#     for frequency in range(10,110,10):
-        
-#         for memory in range(5,105,5):
-             
-#             model = EconomicModel(
-#                 num_econ_agents=70,
-#                 initial_cops=2,
-#                 width=10,
-#                 height=10,
-#                 election_frequency=frequency,
-#                 sentence_length=15,
-#                 interaction_memory=memory,
-#                 risk_aversion_std=0.1,
-#                 trading_skill_std= 0.1
-#             )
-
-#             for step in range(1000):
-#                 model.step()
-
-#             step_data = model.datacollector.get_model_vars_dataframe().iloc[-1].to_dict()
-#             results.append(step_data)
-
-#             print(results)
-
-
-
-def varying_trading_std():
-
-    StandardD = []
-    results_crime = []
-    
-    for sd in np.linspace(0, 1, 11):
-
-        results_this_sd = []
-
-        for repeats in range(40):
-             
-            model = EconomicModel(
-                num_econ_agents=70,
-                initial_cops=2,
-                width=10,
-                height=10,
-                election_frequency=70,
-                sentence_length=15,
-                interaction_memory=20,
-                risk_aversion_std=0.1,
-                trading_skill_std= sd
-            )
-
-            for step in range(1000):
-                model.step()
-
-            step_data = model.datacollector.get_model_vars_dataframe().iloc[-1].to_dict()
-            results_this_sd.append(step_data['num_crimes_committed'])
-        
-        
-        average_crime = np.mean(results_this_sd)
-        print(average_crime, sd)
-        
-        StandardD.append(sd)
-        results_crime.append(average_crime)
-
-    plt.scatter(StandardD, results_crime)
-    plt.xlabel('Standard deviation of trading skill')
+# shared by the sweeps below, each changes one or two of these
+BASE = dict(
+    num_econ_agents=70,
+    initial_cops=2,
+    width=10,
+    height=10,
+    election_frequency=70,
+    sentence_length=15,
+    interaction_memory=20,
+    risk_aversion_std=0.1,
+    trading_skill_std=0.1
+)
+
+def _cache(config_path='config.toml'):
+    """
+    The run cache of config.toml [simulation] (cache_dir and cache_max_mb), shared with experiment.py, so runs
+    repeated across sweeps or reruns are simulated once. Built when a sweep starts, not on import.
+
+    Returns:
+    - RunCache: The cache, or None if cache_dir is empty.
+    """
+    sim_settings = toml.load(config_path)['simulation']
+    cache_dir = sim_settings.get('cache_dir', '')
+    if not cache_dir:
+        return None
+    cache_max_mb = sim_settings.get('cache_max_mb')
+    return RunCache(cache_dir, None if cache_max_mb is None else int(cache_max_mb * 2**20))
+
+def plot_average_crime(results, axis, xlabel, path):
+    average_crime = summarize(results)
+    print(average_crime.to_string(index=False))
+
+    plt.scatter(average_crime[axis], average_crime['num_crimes_committed_mean'])
+    plt.xlabel(xlabel)
     plt.ylabel('average_amount_arrested')
-    plt.savefig('src/extra_graphs/Increase in trading skill gap vs amount of crimes commited 2.png')
+    plt.savefig(path)
     plt.close()
 
+def memory_vs_election():
+    results = sweep(BASE, {'election_frequency': range(10, 110, 10), 'interaction_memory': range(5, 105, 5)}, repeats=1,
+                    outputs=['num_crimes_committed', 'num_cops', 'total_wealth'], cache=_cache())
+    print(results)
+    return results
 
-def varying_risk_std():
-
-    StandardD = []
-    results_crime = []
-    
-    for sd in np.linspace(0, 1, 11):
-
-        results_this_sd = []
-
-        for repeats in range(40):
-             
-            model = EconomicModel(
-                num_econ_agents=70,
-                initial_cops=2,
-                width=10,
-                height=10,
-                election_frequency=70,
-                sentence_length=15,
-                interaction_memory=20,
-                risk_aversion_std= sd,
-                trading_skill_std= 0.1
-            )
-
-            for step in range(1000):
-                model.step()
-
-            step_data = model.datacollector.get_model_vars_dataframe().iloc[-1].to_dict()
-            results_this_sd.append(step_data['num_crimes_committed'])
-        
-        
-        average_crime = np.mean(results_this_sd)
-        print(average_crime, sd)
-        
-        StandardD.append(sd)
-        results_crime.append(average_crime)
-
-    plt.scatter(StandardD, results_crime)
-    plt.xlabel('Standard deviation of risk aversion')
-    plt.ylabel('average_amount_arrested')
-    plt.savefig('src/extra_graphs/Increase in SD risk aversion vs amount of crimes commited 2.png')
-    plt.close()
+def varying_trading_std():
+    results = sweep(BASE, {'trading_skill_std': np.linspace(0, 1, 11)}, cache=_cache())
+    plot_average_crime(results, 'trading_skill_std', 'Standard deviation of trading skill',
+                       'src/extra_graphs/Increase in trading skill gap vs amount of crimes commited 2.png')
 
+def varying_risk_std():
+    results = sweep(BASE, {'risk_aversion_std': np.linspace(0, 1, 11)}, cache=_cache())
+    plot_average_crime(results, 'risk_aversion_std', 'Standard deviation of risk aversion',
+                       'src/extra_graphs/Increase in SD risk aversion vs amount of crimes commited 2.png')
 
 def wide_trade_police():
-
-
-    starting_cops = []
-    results_crime = []
-    
-    for cops in range(0, 20, 2):
-
-        results_this_sd = []
-
-        for repeats in range(40):
-             
-            model = EconomicModel(
-                num_econ_agents=70,
-                initial_cops=cops,
-                width=10,
-                height=10,
-                election_frequency=70,
-                sentence_length=15,
-                interaction_memory=20,
-                risk_aversion_std= 0.1,
-                trading_skill_std= 0.6
-            )
-
-            for step in range(1000):
-                model.step()
-
-            step_data = model.datacollector.get_model_vars_dataframe().iloc[-1].to_dict()
-            results_this_sd.append(step_data['num_crimes_committed'])
-        
-        
-        average_crime = np.mean(results_this_sd)
-        print(average_crime, cops)
-        
-        starting_cops.append(cops)
-        results_crime.append(average_crime)
-
-    plt.scatter(starting_cops, results_crime)
-    plt.xlabel('Amount of starting police')
-    plt.ylabel('average_amount_arrested')
-    plt.savefig('src/extra_graphs/Change in starting cops for a wide trade skill.png')
-    plt.close()
+    results = sweep({**BASE, 'trading_skill_std': 0.6}, {'initial_cops': range(0, 20, 2)}, cache=_cache())
+    plot_average_crime(results, 'initial_cops', 'Amount of starting police', 'src/extra_graphs/Change in starting cops for a wide trade skill.png')
 
 def wide_risk_police():
-
-
-    starting_cops = []
-    results_crime = []
-    
-    for cops in range(0, 20, 2):
-
-        results_this_sd = []
-
-        for repeats in range(40):
-             
-            model = EconomicModel(
-                num_econ_agents=70,
-                initial_cops=cops,
-                width=10,
-                height=10,
-                election_frequency=70,
-                sentence_length=15,
-                interaction_memory=20,
-                risk_aversion_std= 0.6,
-                trading_skill_std= 0.1
-            )
-
-            for step in range(1000):
-                model.step()
-
-            step_data = model.datacollector.get_model_vars_dataframe().iloc[-1].to_dict()
-            results_this_sd.append(step_data['num_crimes_committed'])
-        
-        
-        average_crime = np.mean(results_this_sd)
-        print(average_crime, cops)
-        
-        starting_cops.append(cops)
-        results_crime.append(average_crime)
-
-    plt.scatter(starting_cops, results_crime)
-    plt.xlabel('Amount of starting police')
-    plt.ylabel('average_amount_arrested')
-    plt.savefig('src/extra_graphs/Change in starting cops for a wide risk aversion.png')
-    plt.close()
+    results = sweep({**BASE, 'risk_aversion_std': 0.6}, {'initial_cops': range(0, 20, 2)}, cache=_cache())
+    plot_average_crime(results, 'initial_cops', 'Amount of starting police', 'src/extra_graphs/Change in starting cops for a wide risk aversion.png')
 
 def wide_trade_sentence():
-
-    sentence_length = []
-    results_crime = []
-    
-    for length in range(5,50,5):
-
-        results_this_sd = []
-
-        for repeats in range(40):
-             
-            model = EconomicModel(
-                num_econ_agents=70,
-                initial_cops=2,
-                width=10,
-                height=10,
-                election_frequency=70,
-                sentence_length=length,
-                interaction_memory=20,
-                risk_aversion_std= 0.1,
-                trading_skill_std= 0.6
-            )
-
-            for step in range(1000):
-                model.step()
-
-            step_data = model.datacollector.get_model_vars_dataframe().iloc[-1].to_dict()
-            results_this_sd.append(step_data['num_crimes_committed'])
-        
-        
-        average_crime = np.mean(results_this_sd)
-        print(average_crime, length)
-        
-        sentence_length.append(length)
-        results_crime.append(average_crime)
-
-    plt.scatter(sentence_length, results_crime)
-    plt.xlabel('Sentence Length')
-    plt.ylabel('average_amount_arrested')
-    plt.savefig('src/extra_graphs/Change in sentence length for a wide trade skill.png')
-    plt.close()
+    results = sweep({**BASE, 'trading_skill_std': 0.6}, {'sentence_length': range(5, 50, 5)}, cache=_cache())
+    plot_average_crime(results, 'sentence_length', 'Sentence Length', 'src/extra_graphs/Change in sentence length for a wide trade skill.png')
 
 def wide_aversion_sentence():
-
-    sentence_length = []
-    results_crime = []
-    
-    for length in range(5,50,5):
-
-        results_this_sd = []
-
-        for repeats in range(40):
-             
-            model = EconomicModel(
-                num_econ_agents=70,
-                initial_cops=2,
-                width=10,
-                height=10,
-                election_frequency=70,
-                sentence_length=length,
-                interaction_memory=20,
-                risk_aversion_std= 0.6,
-                trading_skill_std= 0.1
-            )
-
-            for step in range(1000):
-                model.step()
-
-            step_data = model.datacollector.get_model_vars_dataframe().iloc[-1].to_dict()
-            results_this_sd.append(step_data['num_crimes_committed'])
-        
-        
-        average_crime = np.mean(results_this_sd)
-        print(average_crime, length)
-        
-        sentence_length.append(length)
-        results_crime.append(average_crime)
-
-    plt.scatter(sentence_length, results_crime)
-    plt.xlabel('Sentence Length')
-    plt.ylabel('average_amount_arrested')
-    plt.savefig('src/extra_graphs/Change in sentence length for a wide risk aversion.png')
-    plt.close()
+    results = sweep({**BASE, 'risk_aversion_std': 0.6}, {'sentence_length': range(5, 50, 5)}, cache=_cache())
+    plot_average_crime(results, 'sentence_length', 'Sentence Length', 'src/extra_graphs/Change in sentence length for a wide risk aversion.png')
 
 def changing_sentence():
+    results = sweep(BASE, {'sentence_length': range(5, 50, 5)}, cache=_cache())
+    plot_average_crime(results, 'sentence_length', 'Sentence length', 'src/extra_graphs/Change in sentence length vs crime rate.png')
 
-    sentence_length = []
-    results_crime = []
-    
-    for length in range(5,50,5):
-
-        results_this_sd = []
-
-        for repeats in range(40):
-             
-            model = EconomicModel(
-                num_econ_agents=70,
-                initial_cops=2,
-                width=10,
-                height=10,
-                election_frequency=70,
-                sentence_length=length,
-                interaction_memory=20,
-                risk_aversion_std= 0.1,
-                trading_skill_std= 0.1
-            )
-
-            for step in range(1000):
-                model.step()
-
-            step_data = model.datacollector.get_model_vars_dataframe().iloc[-1].to_dict()
-            results_this_sd.append(step_data['num_crimes_committed'])
-        
-        
-        average_crime = np.mean(results_this_sd)
-        print(average_crime, length)
-        
-        sentence_length.append(length)
-        results_crime.append(average_crime)
-
-    plt.scatter(sentence_length, results_crime)
-    plt.xlabel('Sentence length')
-    plt.ylabel('average_amount_arrested')
-    plt.savefig('src/extra_graphs/Change in sentence length vs crime rate.png')
-    plt.close()
-    
-            
 def change_starting_police():
-
-    starting_cops = []
-    results_crime = []
-    
-    for cops in range(0, 20, 2):
-
-        results_this_sd = []
-
-        for repeats in range(40):
-             
-            model = EconomicModel(
-                num_econ_agents=70,
-                initial_cops=cops,
-                width=10,
-                height=10,
-                election_frequency=70,
-                sentence_length=15,
-                interaction_memory=20,
-                risk_aversion_std= 0.6,
-                trading_skill_std= 0.1
-            )
-
-            for step in range(1000):
-                model.step()
-
-            step_data = model.datacollector.get_model_vars_dataframe().iloc[-1].to_dict()
-            results_this_sd.append(step_data['num_crimes_committed'])
-        
-        
-        average_crime = np.mean(results_this_sd)
-        print(average_crime, cops)
-        
-        starting_cops.append(cops)
-        results_crime.append(average_crime)
-
-    plt.scatter(starting_cops, results_crime)
-    plt.xlabel('Amount of starting police')
-    plt.ylabel('average_amount_arrested')
-    plt.savefig('src/extra_graphs/Change in starting cops for a wide risk aversion.png')
-    plt.close()
-
+    # same runs as wide_risk_police, so after it they are read from the run cache
+    results = sweep({**BASE, 'risk_aversion_std': 0.6}, {'initial_cops': range(0, 20, 2)}, cache=_cache())
+    plot_average_crime(results, 'initial_cops', 'Amount of starting police', 'src/extra_graphs/Change in starting cops for a wide risk aversion.png')
 
 def change_tax_rate():
-
-    starting_taxx = []
-    results_crime = []
-    
-    for taxx in np.linspace(0.01,0.1,10):
-
-        results_this_sd = []
-
-        for repeats in range(40):
-             
-            model = EconomicModel(
-                num_econ_agents=70,
-                initial_cops=2,
-                width=10,
-                height=10,
-                election_frequency=70,
-                sentence_length=15,
-                interaction_memory=20,
-                risk_aversion_std= 0.1,
-                trading_skill_std= 0.1,
-                tax_per_cop = taxx
-            )
-
-            for step in range(1000):
-                model.step()
-
-            step_data = model.datacollector.get_model_vars_dataframe().iloc[-1].to_dict()
-            results_this_sd.append(step_data['num_crimes_committed'])
-        
-        
-        average_crime = np.mean(results_this_sd)
-        print(average_crime, taxx)
-        
-        starting_taxx.append(taxx)
-        results_crime.append(average_crime)
-
-    plt.scatter(starting_taxx, results_crime)
-    plt.xlabel('Amount of starting taxx')
-    plt.ylabel('average_amount_arrested')
-    plt.savefig('src/extra_graphs/Change in tax rate on crime.png')
-    plt.close()
+    results = sweep(BASE, {'tax_per_cop': np.linspace(0.01, 0.1, 10)}, cache=_cache())
+    plot_average_crime(results, 'tax_per_cop', 'Amount of starting taxx', 'src/extra_graphs/Change in tax rate on crime.png')
 
 
-# varying_trading_std()
-# varying_risk_std()
+# the sweeps run in worker processes, which must be able to import this module without running them
+if __name__ == '__main__':
+    # varying_trading_std()
+    # varying_risk_std()
 
-# changing_sentence()
-# change_starting_police()
+    # changing_sentence()
+    # change_starting_police()
 
 
-# wide_aversion_sentence()
-# wide_trade_sentence()
-# wide_risk_police()
-# wide_trade_police()
+    # wide_aversion_sentence()
+    # wide_trade_sentence()
+    # wide_risk_police()
+    # wide_trade_police()
 
-change_tax_rate()
+    change_tax_rate()
 
-# trading_skill_tests()
-# starting_wealth()
-# risk_check()
-#memory_vs_election()
\ No newline at end of file
+    # trading_skill_tests()
+    # starting_wealth()
+    # risk_check()
+    # memory_vs_election()
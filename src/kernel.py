@@ -0,0 +1,281 @@
+import warnings
+import numpy as np
+from model import EconomicModel
+from vectorized_model import VectorizedEconomicModel, equivalence_check
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+    jit = numba.njit(cache=True)
+except ImportError:
+    # without numba the kernel still runs as plain Python, which is only useful for checking it
+    NUMBA_AVAILABLE = False
+    def jit(function):
+        return function
+
+# indices into the queue tuples passed to the kernel
+INCOMES, CRIME_PERCEPTION, INTERACTIONS = 0, 1, 2
+
+# indices into the totals returned by the kernel
+CRIMES, STOLEN, TRADE_INCOME, ARRESTS, TAX_PAID, VOTES = range(6)
+
+@jit
+def _append(values, head, count, total, i, value):
+    """Append value to queue i of a QueueArray given by its arrays."""
+    capacity = values.shape[1]
+    if count[i] == capacity:
+        total[i] -= values[i, head[i]]
+    else:
+        count[i] += 1
+    values[i, head[i]] = value
+    total[i] += value
+    head[i] = (head[i] + 1) % capacity
+
+@jit
+def _cell_add(i, cell, cell_head, next_in_cell, prev_in_cell):
+    first = cell_head[cell]
+    next_in_cell[i] = first
+    prev_in_cell[i] = -1
+    if first >= 0:
+        prev_in_cell[first] = i
+    cell_head[cell] = i
+
+@jit
+def _cell_remove(i, cell, cell_head, next_in_cell, prev_in_cell):
+    if prev_in_cell[i] >= 0:
+        next_in_cell[prev_in_cell[i]] = next_in_cell[i]
+    else:
+        cell_head[cell] = next_in_cell[i]
+    if next_in_cell[i] >= 0:
+        prev_in_cell[next_in_cell[i]] = prev_in_cell[i]
+
+@jit
+def step_kernel(order, u_move, u_pick, steps, width, height, prosperity, sentence_length, tax_rate, election_frequency, interaction_memory,
+                x, y, cop_x, cop_y, cell_head, next_in_cell, prev_in_cell, crimes_in_cell, scratch,
+                wealth, trading_skill, risk_aversion, num_interactions, num_crimes_witnessed, num_been_crimed,
+                total_trading_gain, total_stealing_gain, crimes_committed_agent, amount_arrested,
+                has_traded, has_crime, is_arrested, time_until_released, q_values, q_head, q_count, q_total):
+    """
+    One activation of every agent, in the order given, as EconomicAgent.step and CopAgent.step do it.
+
+    order holds agent ids, economic agents are 0..n-1 and cop k is n+k. u_move (per position in order) and
+    u_pick (per economic agent) are uniform numbers for the moves and partner picks. Economic agents are kept
+    in a linked list per cell (cell_head/next_in_cell/prev_in_cell) and crimes_in_cell counts this turn's
+    criminals per cell. The queues are passed as tuples of the QueueArray arrays, indexed by INCOMES,
+    CRIME_PERCEPTION and INTERACTIONS.
+
+    Returns an array with the model totals of the step, indexed by CRIMES, STOLEN, TRADE_INCOME,
+    ARRESTS, TAX_PAID and VOTES.
+    """
+    n = x.shape[0]
+    totals = np.zeros(6)
+    alpha = -1.2 # shape parameter for the pareto distribution
+    sp = 1 # scale parameter for the pareto distribution
+    transformed_sentence_length = sp / (sentence_length ** (1 / alpha))
+    election = steps % election_frequency == 0
+
+    for k in range(order.shape[0]):
+        agent = order[k]
+        if agent < n:
+            i = agent
+            has_traded[i] = False
+            if has_crime[i]:
+                has_crime[i] = False
+                crimes_in_cell[x[i]*height + y[i]] -= 1
+
+            #if they're in jail they don't do anything
+            if is_arrested[i]:
+                time_until_released[i] -= 1
+                if time_until_released[i] == 0:
+                    is_arrested[i] = False
+            else:
+                # move to one of the 8 neighbouring cells
+                d = int(u_move[k] * 8)
+                d += d >= 4 # skip staying put
+                _cell_remove(i, x[i]*height + y[i], cell_head, next_in_cell, prev_in_cell)
+                x[i] = (x[i] + d // 3 - 1) % width
+                y[i] = (y[i] + d % 3 - 1) % height
+                cell = x[i]*height + y[i]
+                _cell_add(i, cell, cell_head, next_in_cell, prev_in_cell)
+
+                # choose a free cellmate
+                m = 0
+                j = cell_head[cell]
+                while j >= 0:
+                    if j != i and not is_arrested[j]:
+                        scratch[m] = j
+                        m += 1
+                    j = next_in_cell[j]
+
+                if m > 0:
+                    o = scratch[int(u_pick[i] * m)]
+                    # decide_action
+                    if q_count[CRIME_PERCEPTION][i] > 0:
+                        arrest_chance = q_total[CRIME_PERCEPTION][i] / q_count[CRIME_PERCEPTION][i]
+                    else:
+                        arrest_chance = 0.0
+                    mean_income = q_total[INCOMES][i] / q_count[INCOMES][i]
+                    expected_punishment_pain = wealth[i] + risk_aversion[i] * (transformed_sentence_length * mean_income)
+                    theft_EU = wealth[o]/2 - expected_punishment_pain*arrest_chance
+                    trade_EU = (wealth[o] + wealth[i]) * prosperity * trading_skill[i]
+
+                    if trade_EU >= theft_EU:
+                        trade_value = (wealth[o] + wealth[i]) * prosperity
+                        wealth[o] += trade_value * trading_skill[o]
+                        wealth[i] += trade_value * trading_skill[i]
+                        total_trading_gain[i] += trade_value * trading_skill[i]
+                        total_trading_gain[o] += trade_value * trading_skill[o]
+                        num_interactions[i] += 1
+                        num_interactions[o] += 1
+                        has_traded[i] = True
+                        has_traded[o] = True
+                        _append(q_values[INTERACTIONS], q_head[INTERACTIONS], q_count[INTERACTIONS], q_total[INTERACTIONS], o, 0.0)
+                        _append(q_values[INCOMES], q_head[INCOMES], q_count[INCOMES], q_total[INCOMES], i, trade_value)
+                        totals[TRADE_INCOME] += 2*trade_value
+                    else:
+                        theft_value = wealth[o]/2
+                        wealth[i] += theft_value
+                        wealth[o] -= theft_value
+                        total_stealing_gain[i] += theft_value
+                        crimes_committed_agent[i] += 1
+                        _append(q_values[INCOMES], q_head[INCOMES], q_count[INCOMES], q_total[INCOMES], i, theft_value)
+                        # EconomicAgent.steal books every theft twice, keep the same accounting
+                        totals[STOLEN] += 2*theft_value
+                        totals[CRIMES] += 2
+                        has_crime[i] = True
+                        crimes_in_cell[cell] += 1
+                        num_been_crimed[o] += 1
+                        num_interactions[i] += 1
+                        num_interactions[o] += 1
+                        _append(q_values[INTERACTIONS], q_head[INTERACTIONS], q_count[INTERACTIONS], q_total[INTERACTIONS], o, 1.0)
+
+                # check for crimes within vision, the agent's own included
+                crimes_seen = 0
+                for dx in range(-1, 2):
+                    for dy in range(-1, 2):
+                        crimes_seen += crimes_in_cell[((x[i] + dx) % width)*height + (y[i] + dy) % height]
+                for _ in range(crimes_seen):
+                    _append(q_values[CRIME_PERCEPTION], q_head[CRIME_PERCEPTION], q_count[CRIME_PERCEPTION], q_total[CRIME_PERCEPTION], i, 0.0)
+                num_crimes_witnessed[i] += crimes_seen
+
+            wealth[i] -= wealth[i] * tax_rate
+            totals[TAX_PAID] += wealth[i] * tax_rate
+
+            if election:
+                crime_rate = q_total[INTERACTIONS][i] / interaction_memory
+                theft_threat = crime_rate * wealth[i] * risk_aversion[i] * 0.5
+                tax_burden = wealth[i] * tax_rate
+                totals[VOTES] += 1 if theft_threat > tax_burden else -1
+        else:
+            c = agent - n
+            # move, staying put is allowed
+            d = int(u_move[k] * 9)
+            cop_x[c] = (cop_x[c] + d // 3 - 1) % width
+            cop_y[c] = (cop_y[c] + d % 3 - 1) % height
+
+            # look for crimes and arrest
+            for dx in range(-1, 2):
+                for dy in range(-1, 2):
+                    cell = ((cop_x[c] + dx) % width)*height + (cop_y[c] + dy) % height
+                    if crimes_in_cell[cell] == 0:
+                        continue
+                    j = cell_head[cell]
+                    while j >= 0:
+                        if has_crime[j]:
+                            wealth[j] = 1 # like CopAgent.arrest in agent.py
+                            is_arrested[j] = True
+                            time_until_released[j] = sentence_length
+                            amount_arrested[j] += 1
+                            has_crime[j] = False
+                            crimes_in_cell[cell] -= 1
+                            totals[ARRESTS] += 1
+                            # make the arrest announcement, jailed agents hear it too
+                            for ax in range(-1, 2):
+                                for ay in range(-1, 2):
+                                    h = cell_head[((cop_x[c] + ax) % width)*height + (cop_y[c] + ay) % height]
+                                    while h >= 0:
+                                        _append(q_values[CRIME_PERCEPTION], q_head[CRIME_PERCEPTION], q_count[CRIME_PERCEPTION], q_total[CRIME_PERCEPTION], h, 1.0)
+                                        h = next_in_cell[h]
+                        j = next_in_cell[j]
+    return totals
+
+class KernelEconomicModel(VectorizedEconomicModel):
+    def __init__(self, *args, **kwargs):
+        """
+        EconomicModel with its step run by step_kernel, compiled with Numba when it is installed.
+
+        Takes the same parameters as VectorizedEconomicModel and keeps its arrays, reporters and elections,
+        but activates the agents one at a time in a random order like EconomicModel, so no batching
+        approximations are needed. EconomicModel stays the reference implementation; see equivalence_check.
+        Use make_model to fall back to EconomicModel when Numba is not available.
+        """
+        super().__init__(*args, **kwargs)
+        n = self.num_agents
+        self.cell_head = np.full(self.width*self.height, -1, dtype=np.int64)
+        self.next_in_cell = np.full(n, -1, dtype=np.int64)
+        self.prev_in_cell = np.full(n, -1, dtype=np.int64)
+        for i, cell in enumerate(self.cell):
+            _cell_add(i, cell, self.cell_head, self.next_in_cell, self.prev_in_cell)
+        self.crimes_in_cell = np.zeros(self.width*self.height, dtype=np.int64)
+        self._scratch = np.empty(n, dtype=np.int64)
+
+    def step(self):
+        """
+        Execute one step of the model simulation, see EconomicModel.step.
+        """
+        self.steps += 1
+        order = self.rng.permutation(self.num_agents + self.num_cops_placed)
+        queues = (self.q_incomes, self.q_crime_perception, self.q_interactions)
+        totals = step_kernel(
+            order, self.rng.random(order.size), self.rng.random(self.num_agents), self.steps, self.width, self.height,
+            self.prosperity, self.sentence_length, self.tax_rate, self.election_frequency, self.interaction_memory,
+            self.x, self.y, self.cop_x, self.cop_y, self.cell_head, self.next_in_cell, self.prev_in_cell, self.crimes_in_cell, self._scratch,
+            self.wealth, self.trading_skill, self.risk_aversion, self.num_interactions, self.num_crimes_witnessed, self.num_been_crimed,
+            self.total_trading_gain, self.total_stealing_gain, self.crimes_committed_agent, self.amount_arrested,
+            self.has_traded_this_turn, self.has_committed_crime_this_turn, self.is_arrested, self.time_until_released,
+            tuple(q.values for q in queues), tuple(q.head for q in queues), tuple(q.count for q in queues), tuple(q.total for q in queues))
+
+        self.num_crimes_committed += int(totals[CRIMES])
+        self.total_stolen += totals[STOLEN]
+        self.total_trade_income += totals[TRADE_INCOME]
+        self.num_arrests_made += int(totals[ARRESTS])
+        self.total_tax_paid += totals[TAX_PAID]
+        self.votes += int(totals[VOTES])
+
+        if self.steps % self.interaction_memory == 0:
+            for queue in queues:
+                queue.resync()
+
+        self.hold_election()
+        self.datacollector.collect(self)
+
+_fallback_warned = False
+
+def make_model(use_kernel=False, seed=None, **params):
+    """
+    Create the model for one run.
+
+    Parameters:
+    - use_kernel (bool): Run the step with the compiled KernelEconomicModel (config.toml [simulation] jit_kernel).
+      Falls back to EconomicModel, with a warning, when Numba is not installed.
+    - seed (int, optional): Seed of the run.
+    - params: EconomicModel parameters.
+
+    Returns:
+    - EconomicModel or KernelEconomicModel
+    """
+    global _fallback_warned
+    if use_kernel and NUMBA_AVAILABLE:
+        return KernelEconomicModel(**params, seed=seed)
+    if use_kernel and not _fallback_warned:
+        warnings.warn("jit_kernel is set but numba is not installed, running EconomicModel instead")
+        _fallback_warned = True
+    return EconomicModel(**params, seed=seed)
+
+if __name__ == '__main__':
+    if not NUMBA_AVAILABLE:
+        print('numba is not installed, checking the kernel as plain Python (slow)')
+    result = equivalence_check(model_class=KernelEconomicModel)
+    print(result.to_string(index=False))
+    if not result['passed'].all():
+        raise SystemExit('KernelEconomicModel is not statistically equivalent to EconomicModel')
@@ -1,7 +1,11 @@
 import mesa
 from mesa.datacollection import DataCollector
-import numpy as np
 from agent import EconomicAgent, CopAgent
+from space import IndexedMultiGrid
+from aggregates import AggregateTracker
+from schedule import AgentRegistry, JailActivation
+from rng import RandomStreams
+from collection import PolicyDataCollector
 
 def compute_gini(model):
     """
@@ -16,14 +20,20 @@ def compute_gini(model):
     Returns:
     - float: The Gini coefficient, where 0 represents perfect equality and 1 represents maximum inequality.
     """
-    agent_wealths = [agent.wealth for agent in model.schedule.agents if isinstance(agent, EconomicAgent)]
-    x = sorted(agent_wealths)
-    N = model.num_agents
-    B = sum(xi * (N - i) for i, xi in enumerate(x)) / (N * sum(x))
-    return 1 + (1 / N) - 2 * B
+    return model.aggregates.gini(model.num_agents)
+
+# reporters are module-level functions rather than lambdas, so a model can be pickled by snapshot.snapshot
+def compute_avg_wealth(model):
+    return model.aggregates.avg_wealth()
+
+def compute_total_wealth(model):
+    return model.aggregates.total_wealth
+
+def compute_avg_crime_perception(model):
+    return model.aggregates.avg_crime_perception()
 
 class EconomicModel(mesa.Model):
-    def __init__(self, num_econ_agents, initial_cops=0, width=20, height=20, election_frequency = 70, sentence_length = 20, interaction_memory = 50, risk_aversion_std = 0.3, trading_skill_std = 0.3, tax_per_cop = 0.01):
+    def __init__(self, num_econ_agents, initial_cops=0, width=20, height=20, election_frequency = 70, sentence_length = 20, interaction_memory = 50, risk_aversion_std = 0.3, trading_skill_std = 0.3, tax_per_cop = 0.01, seed = None, collect_model = 'every', collect_agents = 'every'):
         """
         Initialize an instance of EconomicModel
 
@@ -38,17 +48,24 @@ class EconomicModel(mesa.Model):
         - risk_aversion_std (float): The standard deviation for the distribution of risk aversion among agents.
         - trading_skill_std (float): The standard deviation for the distribution of trading skills among agents.
         - tax_per_cop (float): The tax rate increment per cop agent.
+        - seed (int, optional): Seed for all of the model's randomness, None gives a different run every time.
+        - collect_model (str): Collection policy of the model reporters, see collection.CollectionPolicy.
+        - collect_agents (str): Collection policy of the agent reporters, see collection.CollectionPolicy.
 
         Initializes agents, grid, scheduler, data collectors, and other parameters.
         """
         super().__init__()
+        # mesa seeds self.random from the seed keyword, the numpy streams are seeded from it in turn
+        self.streams = RandomStreams(self.random.getrandbits(64))
         self.num_agents = num_econ_agents
         self.num_cops = int(initial_cops)
 
-        #create scheduler for movement and voting
-        self.schedule = mesa.time.RandomActivation(self)
+        #economic agents and cops by type, kept up to date by the scheduler
+        self.registry = AgentRegistry()
+        #create scheduler for movement and voting, jailed agents are parked outside the activation order
+        self.schedule = JailActivation(self, self.registry)
         #space
-        self.grid = mesa.space.MultiGrid(width, height, torus = True)
+        self.grid = IndexedMultiGrid(width, height, torus = True)
 
         #parameters
         self.sentence_length = sentence_length
@@ -69,10 +86,12 @@ class EconomicModel(mesa.Model):
         self.total_trade_income = 0
         self.steps = 0
         self.total_tax_paid = 0
+        # wealth and crime perception aggregates of the economic agents for the reporters
+        self.aggregates = AggregateTracker(self)
         
         # create agents
         for i in range(self.num_agents):
-            trade = np.random.normal(1, trading_skill_std)
+            trade = self.streams.attributes.normal(1, trading_skill_std)
             if trade < 0.1: 
                 trade = 0.1
             a = EconomicAgent(i, self, trade)
@@ -88,7 +107,9 @@ class EconomicModel(mesa.Model):
             self.grid.place_agent(c, (x, y))
 
         # add data collecor
-        self.datacollector = mesa.DataCollector(
+        self.datacollector = PolicyDataCollector(
+            model_policy = collect_model,
+            agent_policy = collect_agents,
             model_reporters = {
                 'Step': 'steps',
                 'num_cops': 'num_cops',
@@ -97,9 +118,9 @@ class EconomicModel(mesa.Model):
                 'tax_rate': 'tax_rate',
                 'total_stolen': 'total_stolen',
                 'total_trade_income': 'total_trade_income',
-                'avg_wealth': lambda m: np.mean([agent.wealth for agent in m.schedule.agents if isinstance(agent, EconomicAgent)]),
-                'total_wealth': lambda m: sum(agent.wealth for agent in m.schedule.agents if isinstance(agent, EconomicAgent)),
-                'avg_crime_perception': lambda m: np.mean([sum(agent.q_crime_perception) / len(agent.q_crime_perception) if len(agent.q_crime_perception) > 0 else 0 for agent in m.schedule.agents if isinstance(agent, EconomicAgent)]),
+                'avg_wealth': compute_avg_wealth,
+                'total_wealth': compute_total_wealth,
+                'avg_crime_perception': compute_avg_crime_perception,
                 'vote_outcome': 'votes',
                 'gini_coeff': compute_gini
             },
@@ -119,6 +140,11 @@ class EconomicModel(mesa.Model):
         """
         self.steps += 1
         self.schedule.step()
+        self.hold_election()
+        self.datacollector.collect(self)
+
+    def hold_election(self):
+        """Adjust the tax rate and the number of cops to the votes on election steps."""
         if (self.steps - 1) % self.election_frequency == 0 and self.steps != 1:
             if self.votes > 0:
                 # print('The people have voted to increase taxes because votes were', self.votes, 'and the tax rate is', self.tax_rate, 'and the number of cops is', self.num_cops, 'and the number of agents is', self.num_agents)
@@ -129,7 +155,7 @@ class EconomicModel(mesa.Model):
         
             # Adjusting the number of cops to voting results
             self.num_cops = int(self.tax_rate / self.tax_per_cop)
-            cops = [x for x in self.agents if isinstance(x, CopAgent)]
+            cops = self.registry.of_type(CopAgent)
 
             if len(cops) < self.num_cops:
                 c = CopAgent(self.next_id(), model = self)
@@ -138,10 +164,8 @@ class EconomicModel(mesa.Model):
                 self.schedule.add(c)
                 self.grid.place_agent(c, (x, y))
             elif len(cops) > self.num_cops and len(cops) > 0: # ensure there is at least one cop to remove
-                cops[0].pos = None
+                self.grid.remove_agent(cops[0])
                 cops[0].remove()
                 self.schedule.remove(cops[0])
             # reset the votes
             self.votes = 0
-
-        self.datacollector.collect(self)
\ No newline at end of file
@@ -0,0 +1,195 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from results_io import ShardSink, iter_results, load_results, join_runs
+from plot import final_step_rows
+
+# the outputs plot_ofat and plot_ofat_final_step show
+OUTPUTS = ['num_crimes_committed', 'num_arrests_made', 'gini_coeff', 'num_cops']
+ATTRS = ['runs', 'stopped_early']
+
+def _shard_columns(path):
+    shards = ShardSink(path).shards()
+    # memory-mapped, so only the header is read
+    return list(np.load(shards[0], mmap_mode='r', allow_pickle=False).dtype.names) if shards else []
+
+def result_columns(path):
+    """Columns of the model results at path, see iter_chunks."""
+    if os.path.isfile(path):
+        return list(pd.read_csv(path, nrows=0).columns)
+    if os.path.isdir(os.path.join(path, 'runs')):
+        return list(dict.fromkeys(_shard_columns(os.path.join(path, 'steps')) + _shard_columns(os.path.join(path, 'runs'))))
+    return _shard_columns(path)
+
+def iter_chunks(path, columns=None, chunksize=1_000_000):
+    """
+    Read model results of any output format piece by piece.
+
+    Parameters:
+    - path (str): A CSV file (output_format "csv"), a ShardSink directory ("shards") or a RunSink directory ("normalized").
+    - columns (list): Columns to read, all by default; they must exist, see result_columns.
+    - chunksize (int): Rows per chunk of a CSV file; shards are read one at a time.
+
+    Yields:
+    - pd.DataFrame: The next rows, with the parameters joined on for a RunSink.
+    """
+    if os.path.isfile(path):
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+    elif os.path.isdir(os.path.join(path, 'runs')):
+        # the runs table has a row per run only, so it fits in memory
+        runs = load_results(os.path.join(path, 'runs'))
+        if columns is not None:
+            runs = runs[['run_id', *[column for column in columns if column in runs and column != 'run_id']]]
+            columns = ['run_id', *[column for column in columns if column not in runs]]
+        for steps in iter_results(os.path.join(path, 'steps'), columns):
+            yield join_runs(runs, steps)
+    else:
+        yield from iter_results(path, columns)
+
+class RunMeans:
+    """
+    Online per-run means of model results, for results too large to load at once.
+
+    Chunks of rows are added one after the other, and for every (parameter value, iteration) only the
+    sums and counts of the outputs are kept: over all steps (the time average plot_ofat shows) and, with
+    last_step_num, over the final-step rows (see plot.final_step_rows) for plot_ofat_final_step. Memory
+    therefore grows with the number of runs, not with the number of rows.
+
+    Parameters:
+    - param_column (str): The varied parameter.
+    - outputs (list): Model reporters to average.
+    - last_step_num (int or None): Final step of the runs, None skips the final-step means.
+    """
+    def __init__(self, param_column, outputs=OUTPUTS, last_step_num=None):
+        self.param_column = param_column
+        self.outputs = list(outputs)
+        self.last_step_num = last_step_num
+        self.keys = [param_column, 'iteration']
+        self.sums = self.counts = self.final_sums = self.final_counts = None
+        self.runs = self.stopped_early = 0
+
+    @staticmethod
+    def _add(total, part):
+        return part if total is None else total.add(part, fill_value=0)
+
+    def add(self, chunk):
+        """Add the rows of chunk, which must have the param_column, iteration and output columns (and Step for final-step means)."""
+        groups = chunk.groupby(self.keys)[self.outputs]
+        self.sums = self._add(self.sums, groups.sum())
+        self.counts = self._add(self.counts, groups.count())
+        if self.last_step_num is not None:
+            final = final_step_rows(chunk, self.last_step_num)
+            groups = final.groupby(self.keys)[self.outputs]
+            self.final_sums = self._add(self.final_sums, groups.sum())
+            self.final_counts = self._add(self.final_counts, groups.count())
+            self.runs += len(final)
+            if 'converged' in final:
+                self.stopped_early += int((final['converged'].astype(bool) & (final['Step'] < self.last_step_num)).sum())
+        return self
+
+    def table(self):
+        """
+        The per-run means.
+
+        Returns:
+        - pd.DataFrame: One row per (parameter value, iteration) with the mean of every output over all steps,
+          <output>_final columns with the final-step means if last_step_num was given, and the number of
+          final-step rows and of runs that stopped early in attrs['runs'] and attrs['stopped_early'].
+        """
+        means = self.sums / self.counts
+        if self.final_sums is not None:
+            means = means.join((self.final_sums / self.final_counts).add_suffix('_final'))
+        means = means.reset_index()
+        means.attrs.update(runs=self.runs, stopped_early=self.stopped_early)
+        return means
+
+def param_stats(run_means, param_column, final=False):
+    """
+    Mean and standard deviation over the iterations of the per-run means, per parameter value.
+
+    Parameters:
+    - run_means (pd.DataFrame): The table of RunMeans (or run_means).
+    - param_column (str): The varied parameter.
+    - final (bool): Use the final-step means instead of the means over all steps.
+
+    Returns:
+    - pd.DataFrame: Indexed by parameter value, with <output>_mean and <output>_std columns, as plot_ofat
+      and plot_ofat_final_step take instead of the raw results.
+    """
+    suffix = '_final' if final else ''
+    outputs = [column[:len(column) - len(suffix)] for column in run_means.columns
+               if column not in (param_column, 'iteration') and column.endswith(suffix) and (final or not column.endswith('_final'))]
+    stats = run_means.groupby(param_column)[[output + suffix for output in outputs]].agg(['mean', 'std'])
+    stats.columns = [f'{column[:len(column) - len(suffix)]}_{stat}' for column, stat in stats.columns]
+    stats.attrs = dict(run_means.attrs)
+    return stats
+
+def _modified(path):
+    # newest modification time of a results file or of anything in a results directory
+    if os.path.isfile(path):
+        return os.path.getmtime(path)
+    return max([os.path.getmtime(root) for root, _, _ in os.walk(path)] +
+               [os.path.getmtime(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files])
+
+def cache_path(path, param_column, last_step_num=None):
+    """Where run_means caches the per-run means of the results at path, next to them."""
+    base = os.path.splitext(path)[0] if os.path.isfile(path) else path.rstrip('/')
+    return f"{base}.means_{param_column}{'' if last_step_num is None else f'_final{last_step_num}'}.csv"
+
+def run_means(path, param_column, last_step_num=None, outputs=OUTPUTS, chunksize=1_000_000, cache=True):
+    """
+    Per-run means of the model results at path in one streaming pass, see RunMeans.
+
+    The table is cached next to the results (see cache_path) and read from there as long as the results
+    are not newer than the cache and it has all outputs.
+
+    Parameters:
+    - path (str): Model results, see iter_chunks.
+    - param_column (str): The varied parameter.
+    - last_step_num (int or None): Final step of the runs, None skips the final-step means.
+    - outputs (list): Model reporters to average.
+    - chunksize (int): Rows per chunk of a CSV file.
+    - cache (bool): Read and write the cached table.
+
+    Returns:
+    - pd.DataFrame: See RunMeans.table.
+    """
+    cached = cache_path(path, param_column, last_step_num)
+    if cache and os.path.exists(cached) and os.path.getmtime(cached) >= _modified(path):
+        means = pd.read_csv(cached)
+        if set(outputs) <= set(means.columns):
+            # the attrs are stored as constant columns
+            for name in ATTRS:
+                means.attrs[name] = int(means.pop(name).iloc[0]) if len(means) else 0
+            return means
+
+    columns = [param_column, 'iteration', 'Step', *outputs]
+    if last_step_num is not None:
+        # the convergence columns, when the runs have them
+        available = result_columns(path)
+        columns += [column for column in ['converged', 'stop_step', *[output + '_per_step' for output in outputs]] if column in available]
+    accumulator = RunMeans(param_column, outputs, last_step_num)
+    for chunk in iter_chunks(path, columns, chunksize):
+        accumulator.add(chunk)
+    means = accumulator.table()
+
+    if cache:
+        tmp = f'{cached}.{os.getpid()}.tmp'
+        means.assign(**{name: means.attrs[name] for name in ATTRS}).to_csv(tmp, index=False)
+        os.replace(tmp, cached)
+    return means
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Per-run means of large model results, cached next to them for plot_ofat:")
+    parser.add_argument('path', type=str, help='Model results: a CSV file, a shards directory or a normalized (RunSink) directory.')
+    parser.add_argument('param_column', type=str, help='The varied parameter.')
+    parser.add_argument('--last-step', type=int, help='Final step of the runs, also averages the final-step rows.')
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help='Rows per chunk of a CSV file.')
+
+    args = parser.parse_args()
+    means = run_means(args.path, args.param_column, args.last_step, chunksize=args.chunksize)
+    print(param_stats(means, args.param_column).to_string())
+    if args.last_step is not None:
+        print(param_stats(means, args.param_column, final=True).to_string())
+    print(f"Cached at {cache_path(args.path, args.param_column, args.last_step)}")
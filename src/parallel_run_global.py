@@ -1,88 +1,214 @@
+import math
+import warnings
 import numpy as np
 import pandas as pd
 from joblib import Parallel, delayed
 from SALib.sample import saltelli
 from SALib.analyze import sobol
+import toml
 from model import EconomicModel, compute_gini
 from agent import EconomicAgent, CopAgent
+from rng import run_seed
+from results_io import ShardSink, RunSink
+from run_cache import RunCache, run_model, config_id, split_duplicates
+from convergence import extrapolate_final
+from screening import bounds_problem, screen_config
+from task_queue import task_queue
 import pickle
 
-def run_simulation(params, max_steps, iteration):
+def run_simulation(params, max_steps, iteration, seed=None, use_kernel=False, collect_model='every', sink=None, run_id=None, cache=None, convergence=None):
     print(f"Iteration {iteration + 1} with params: {params}")
-    model = EconomicModel(
+    model_params = dict(
         num_econ_agents=int(params["num_econ_agents"]),
         initial_cops=int(params["initial_cops"]),
         width=int(params["width"]),
         height=int(params["height"]),
-        election_frequency=params["election_frequency"],
+        election_frequency=int(params["election_frequency"]),
         sentence_length=int(params["sentence_length"]),
         interaction_memory=int(params["interaction_memory"]),
         risk_aversion_std=params["risk_aversion_std"],
         trading_skill_std=params["trading_skill_std"],
         tax_per_cop=params["tax_per_cop"]
     )
-
-
-    for _ in range(max_steps):
-        model.step()
-    
-    # Collect model-level data across all steps
-    model_results = model.datacollector.get_model_vars_dataframe().copy()
+    model_results, _, info = run_model(model_params, max_steps, seed, cache, use_kernel, collect_model, 'never', convergence)
+    if isinstance(sink, RunSink):
+        # the parameters go to the runs table once instead of into every row
+        sink.write(model_results, run_id, params, iteration=iteration + 1, seed=seed, **info)
+        # only the last row goes back, for the analysis, with the rates to extrapolate runs that stopped early
+        return model_results.iloc[[-1]].assign(**{key: value for key, value in info.items() if key != 'wall_time'})
     model_results["iteration"] = iteration + 1
-    model_results["num_econ_agents"] = params["num_econ_agents"]
-    model_results["initial_cops"] = params["initial_cops"]
-    model_results["election_frequency"] = params["election_frequency"]
-    model_results["sentence_length"] = params["sentence_length"]
-    model_results["interaction_memory"] = params["interaction_memory"]
-    model_results["risk_aversion_std"] = params["risk_aversion_std"]
-    model_results["tax_per_cop"] = params["tax_per_cop"]
-    model_results["trading_skill_std"] = params["trading_skill_std"]
+    for key, value in params.items():
+        model_results[key] = value
+    # mark the runs that stopped early at a steady state
+    for key, value in info.items():
+        if key != 'wall_time':
+            model_results[key] = value
+
+    if sink is not None:
+        # write the results from the worker so they are never gathered in memory
+        sink.write(model_results, f'{run_id:08d}')
+        return model_results.iloc[[-1]]
     
     return model_results
 
-def run():
-    max_steps = 500
-    num_samples = 64
-    num_iterations = 50
-    
-    problem = {
-        'num_vars': 5,
-        'names': ['sentence_length', 'interaction_memory', 'risk_aversion_std', 'trading_skill_std', 'tax_per_cop'],
-        'bounds': [[5, 90], [10, 100], [0.1, 0.90], [0.1, 0.90], [0.01, 0.1]]
-    }
-    
-    param_values = saltelli.sample(problem, num_samples, calc_second_order=True)
-
-    params_list = [
-        {
-            "num_econ_agents": 200,
-            "initial_cops": 2,
-            "width": 20,
-            "height": 20,
-            "election_frequency": 70,
-            "sentence_length": param_values[i, 0],
-            "interaction_memory": param_values[i, 1],
-            "risk_aversion_std": param_values[i, 2],
-            "tax_per_cop": param_values[i, 3],
-            "trading_skill_std": param_values[i, 4]
-        }
-        for i in range(len(param_values))
-    ]
+# the parameters analyzed without screening, and the values of the parameters that are not analyzed
+PROBLEM = {
+    'num_vars': 5,
+    'names': ['sentence_length', 'interaction_memory', 'risk_aversion_std', 'trading_skill_std', 'tax_per_cop'],
+    'bounds': [[5, 90], [10, 100], [0.1, 0.90], [0.1, 0.90], [0.01, 0.1]]
+}
+DEFAULTS = {
+    "num_econ_agents": 200,
+    "initial_cops": 2,
+    "election_frequency": 70,
+    "sentence_length": 20,
+    "interaction_memory": 50,
+    "risk_aversion_std": 0.3,
+    "tax_per_cop": 0.01,
+    "trading_skill_std": 0.3,
+    "width": 20,
+    "height": 20
+}
+
+def saltelli_batches(problem, base_samples, max_samples):
+    """
+    Saltelli design in growing batches: base_samples base points first, then as many as there are so far.
+
+    The first batch is saltelli.sample(problem, base_samples) itself, and every later batch continues the
+    Sobol' sequence where the previous one stopped (skip_values), so no model run is thrown away. The batches
+    put together equal saltelli.sample(problem, total, skip_values=skip) with the skip of base_samples; SALib's
+    default skip depends on the number of base points, so its default design for the total can differ.
+
+    Yields:
+    - np.ndarray: The parameter values of the next batch, in Saltelli's order.
+    """
+    # the skip saltelli.sample uses by default for base_samples
+    skip = max(2 ** math.ceil(math.log2(base_samples)), 16)
+    total = 0
+    while total < max_samples:
+        size = min(max(base_samples, total), max_samples - total)
+        with warnings.catch_warnings():
+            # SALib warns about skips that are not a power of 2, but here they only continue the sequence
+            warnings.simplefilter('ignore', UserWarning)
+            yield saltelli.sample(problem, size, calc_second_order=True, skip_values=skip + total)
+        total += size
+
+def analyze(problem, last_rows, num_samples, outputs, max_steps):
+    """
+    Sobol indices of the final-step outputs, averaged over the iterations of every sample, like the notebook.
+
+    Parameters:
+    - problem (dict): SALib problem.
+    - last_rows (pd.DataFrame): Last model row of every run, with sample and iteration columns.
+    - num_samples (int): Number of parameter sets in the design so far.
+    - outputs (list): Model reporters to analyze.
+    - max_steps (int): Final step, runs stopped early by the convergence monitor are extrapolated to it.
+
+    Returns:
+    - pd.DataFrame: S1, S1_conf, ST and ST_conf per output and parameter.
+    """
+    final = extrapolate_final(last_rows, max_steps).groupby('sample')[outputs].mean()
+    rows = []
+    for output in outputs:
+        # cap extreme values like the notebook does for total_wealth
+        Y = final[output].reindex(range(num_samples)).clip(lower=-3e150, upper=3e150).to_numpy()
+        Si = sobol.analyze(problem, Y, calc_second_order=True)
+        for k, name in enumerate(problem['names']):
+            rows.append({'output': output, 'parameter': name, 'S1': Si['S1'][k], 'S1_conf': Si['S1_conf'][k],
+                         'ST': Si['ST'][k], 'ST_conf': Si['ST_conf'][k]})
+    return pd.DataFrame(rows)
+
+def run(use_kernel=False, collect_model='every', output_format='csv', cache_dir='results/run_cache', cache_max_mb=None, convergence=None,
+        base_samples=64, max_samples=1024, ci_threshold=0.05, outputs=('total_wealth', 'num_cops', 'num_crimes_committed'), problem=None, defaults=None,
+        queue=None, max_steps=500, num_iterations=50, seed=42):
+    """
+    Progressive global sensitivity analysis.
+
+    The Saltelli design grows in batches (see saltelli_batches). After every batch all runs so far are
+    analyzed, the indices are appended to results/global_SA_indices.csv, and the analysis stops once the
+    S1 and ST confidence intervals of every output and parameter are at most ci_threshold, or once
+    max_samples base points have been run.
+
+    problem (a SALib problem, PROBLEM by default) gives the parameters that are sampled, e.g. the influential
+    ones found by screening.screen; the other parameters keep their value in defaults (DEFAULTS by default).
+    With a task_queue.TaskQueue the runs go to its workers instead of joblib. max_steps, num_iterations and
+    seed come from config.toml [simulation] when run as a script.
+    """
+    problem = PROBLEM if problem is None else problem
+    defaults = DEFAULTS if defaults is None else defaults
+    if problem['num_vars'] < 2:
+        raise ValueError(f"the Sobol analysis needs at least two parameters, got {problem['names']}")
+
+    sink = None
+    if output_format == 'shards':
+        sink = ShardSink('results/global_SA_last_step_50i')
+        sink.clear()
+    elif output_format == 'normalized':
+        sink = RunSink('results/global_SA_runs')
+        sink.clear()
+
+    cache = None
+    if cache_dir:
+        cache = RunCache(cache_dir, None if cache_max_mb is None else int(cache_max_mb * 2**20))
+
+    params_list = []
+    results = {}
+    indices = []
+    for param_values in saltelli_batches(problem, base_samples, max_samples):
+        first = len(params_list)
+        params_list += [{**defaults, **dict(zip(problem['names'], row))} for row in param_values]
     
-    param_iteration_list = [(params, iteration) for iteration in range(num_iterations) for params in params_list]
+        param_iteration_list = [(p, params_list[p], iteration) for iteration in range(num_iterations) for p in range(first, len(params_list))]
 
-    results = Parallel(n_jobs=-1)(
-        delayed(run_simulation)(params, max_steps, iteration)
-        for params, iteration in param_iteration_list 
-    )
+        # seeds follow the configuration rather than its position, so samples that are equal once cast to int are the same run
+        tasks = [(p, params, iteration, run_seed(seed, config_id(params), iteration)) for p, params, iteration in param_iteration_list]
+        batches = [tasks]
+        if cache is not None:
+            # duplicates run after all unique runs are cached, so they are read instead of simulated again
+            batches = split_duplicates(tasks, lambda task: (config_id(task[1]), task[3]))
+
+        for batch in batches:
+            arg_lists = [(params, max_steps, iteration, task_seed, use_kernel, collect_model, sink, p * num_iterations + iteration, cache, convergence)
+                         for p, params, iteration, task_seed in batch]
+            if queue is not None:
+                batch_results = queue.map(run_simulation, arg_lists)
+            else:
+                batch_results = Parallel(n_jobs=-1)(delayed(run_simulation)(*args) for args in arg_lists)
+            results.update(zip([(p, iteration) for p, _, iteration, _ in batch], batch_results))
+
+        last_rows = pd.concat([model_df.iloc[[-1]].assign(sample=p, iteration=iteration + 1) for (p, iteration), model_df in results.items()],
+                              ignore_index=True)
+        batch_indices = analyze(problem, last_rows, len(params_list), list(outputs), max_steps)
+        batch_indices.insert(0, 'num_samples', len(params_list) // (2 * problem['num_vars'] + 2))
+        indices.append(batch_indices)
+        pd.concat(indices, ignore_index=True).to_csv('results/global_SA_indices.csv', index=False)
+
+        widest = batch_indices[['S1_conf', 'ST_conf']].max().max()
+        print(f"{batch_indices['num_samples'].iloc[0]} base samples: widest S1/ST confidence interval {widest:.4f}")
+        if widest <= ci_threshold:
+            break
+
+    if sink is not None:
+        return
     
     model_results = []
-    for model_df in results:
-        model_results.append(model_df)
+    for iteration in range(num_iterations):
+        for p in range(len(params_list)):
+            model_results.append(results[p, iteration])
 
     model_results_df = pd.concat(model_results, ignore_index=True)
 
     model_results_df.to_csv('results/global_SA_last_step_50i.csv', index=False)
 
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    config = toml.load('config.toml')
+    problem, defaults = None, None
+    if config.get('screening', {}).get('enabled', False):
+        # only the parameters that matter in the Morris screening go on to the Sobol analysis
+        ranking, names = screen_config(config)
+        print(f"Influential parameters: {names}")
+        problem, defaults = bounds_problem(config['bounds'], names), config['defaults']
+    run(problem=problem, defaults=defaults, queue=task_queue(config.get('queue')), use_kernel=config['simulation'].get('jit_kernel', False), collect_model=config['simulation'].get('collect_model', 'every'),
+        output_format=config['simulation'].get('output_format', 'csv'), cache_dir=config['simulation'].get('cache_dir', ''),
+        cache_max_mb=config['simulation'].get('cache_max_mb'), convergence=config.get('convergence'), max_steps=config['simulation'].get('max_steps', 500),
+        num_iterations=config['simulation'].get('num_iterations', 50), seed=config['simulation'].get('seed', 42), **config.get('sobol', {}))
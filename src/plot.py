@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 from itertools import combinations
 from SALib.analyze import sobol
+from convergence import extrapolate_final
 
 def plot_ofat(data, param_column):
     """
@@ -10,7 +11,8 @@ def plot_ofat(data, param_column):
     for several model outputs against a specified parameter from a simulation dataset.
 
     Args:
-    data (pd.DataFrame): The DataFrame containing the simulation data.
+    data (pd.DataFrame): The DataFrame containing the simulation data, or its precomputed
+                         aggregates from ofat_means.param_stats for results too large to load.
     param_column (str): The name of the column in `data` that will be used as the parameter
                         for grouping the data (e.g., 'election_frequency'). This parameter
                         should reflect a simulation variable you want to analyze.
@@ -28,16 +30,19 @@ def plot_ofat(data, param_column):
 
     The function adjusts the layout and displays the plot.
     """
-    # Calculate mean and standard deviation across steps and iterations
-    avg_data_per_step = data.groupby([param_column, 'iteration', 'Step']).mean().reset_index()
-    mean_std_data = avg_data_per_step.groupby([param_column, 'iteration']).mean().groupby(param_column).agg({
-        'num_crimes_committed': ['mean', 'std'],
-        'num_arrests_made': ['mean', 'std'],
-        'gini_coeff': ['mean', 'std'],
-        'num_cops': ['mean', 'std']
-    })
-
-    mean_std_data.columns = ['_'.join(col).rstrip('_') for col in mean_std_data.columns.values]
+    if 'Step' in data:
+        # Calculate mean and standard deviation across steps and iterations
+        avg_data_per_step = data.groupby([param_column, 'iteration', 'Step']).mean().reset_index()
+        mean_std_data = avg_data_per_step.groupby([param_column, 'iteration']).mean().groupby(param_column).agg({
+            'num_crimes_committed': ['mean', 'std'],
+            'num_arrests_made': ['mean', 'std'],
+            'gini_coeff': ['mean', 'std'],
+            'num_cops': ['mean', 'std']
+        })
+
+        mean_std_data.columns = ['_'.join(col).rstrip('_') for col in mean_std_data.columns.values]
+    else:
+        mean_std_data = data
 
     fig, axs = plt.subplots(2, 2, figsize=(10, 8))
     outputs = ['num_crimes_committed', 'num_arrests_made', 'gini_coeff', 'num_cops']
@@ -53,18 +58,49 @@ def plot_ofat(data, param_column):
     plt.tight_layout()
     plt.show()
 
-def plot_ofat_final_step(data, param_column, last_step_num):
-    last_step_data = data[data['Step'] == last_step_num]
+def final_step_rows(data, last_step_num):
+    """
+    Rows of data at the final step, taking the last step of the runs that stopped early at a steady state.
 
-    # Calculate mean and standard deviation for the last step across iterations
-    mean_std_data = last_step_data.groupby([param_column, 'iteration']).mean().groupby(param_column).agg({
-        'num_crimes_committed': ['mean', 'std'],
-        'num_arrests_made': ['mean', 'std'],
-        'gini_coeff': ['mean', 'std'],
-        'num_cops': ['mean', 'std']
-    })
+    Runs stopped by a ConvergenceMonitor (converged column true) have no rows at last_step_num; since they
+    were stationary, their state at stop_step stands in for the final step, with the cumulative counts
+    extrapolated to last_step_num at their steady-state rate (the <column>_per_step columns).
 
-    mean_std_data.columns = ['_'.join(col).rstrip('_') for col in mean_std_data.columns.values]
+    Args:
+    data (pd.DataFrame): The simulation data, with stop_step and converged columns if convergence was enabled.
+    last_step_num (int): The final step of the runs that ran to the end.
+
+    Returns:
+    pd.DataFrame: One row per run.
+    """
+    at_last_step = data['Step'] == last_step_num
+    if 'converged' not in data:
+        return data[at_last_step]
+    converged = data['converged'].astype(bool)
+    return extrapolate_final(data[at_last_step | (converged & (data['Step'] == data['stop_step']))], last_step_num)
+
+def plot_ofat_final_step(data, param_column, last_step_num):
+    """
+    Like plot_ofat, for the final step of the runs (see final_step_rows). data can also be the precomputed
+    aggregates from ofat_means.param_stats(..., final=True).
+    """
+    if 'Step' in data:
+        last_step_data = final_step_rows(data, last_step_num)
+        runs = len(last_step_data)
+        stopped_early = (last_step_data['converged'].astype(bool) & (last_step_data['Step'] < last_step_num)).sum() if 'converged' in last_step_data else 0
+
+        # Calculate mean and standard deviation for the last step across iterations
+        mean_std_data = last_step_data.groupby([param_column, 'iteration']).mean().groupby(param_column).agg({
+            'num_crimes_committed': ['mean', 'std'],
+            'num_arrests_made': ['mean', 'std'],
+            'gini_coeff': ['mean', 'std'],
+            'num_cops': ['mean', 'std']
+        })
+
+        mean_std_data.columns = ['_'.join(col).rstrip('_') for col in mean_std_data.columns.values]
+    else:
+        mean_std_data = data
+        runs, stopped_early = data.attrs.get('runs', 0), data.attrs.get('stopped_early', 0)
 
     fig, axs = plt.subplots(2, 2, figsize=(10, 8))
     outputs = ['num_crimes_committed', 'num_arrests_made', 'gini_coeff', 'num_cops']
@@ -78,6 +114,9 @@ def plot_ofat_final_step(data, param_column, last_step_num):
         ax.set_xlabel(param_column.replace('_', ' ').title())
         ax.set_ylabel(labels[i])
 
+    if stopped_early:
+        fig.suptitle(f'{stopped_early} of {runs} runs stopped early at a steady state, their last step is shown')
+
     plt.tight_layout()
     plt.show()
 
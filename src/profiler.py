@@ -0,0 +1,95 @@
+import time
+import functools
+import pandas as pd
+from model import EconomicModel
+from agent import EconomicAgent, CopAgent
+from schedule import JailActivation
+from collection import PolicyDataCollector
+from vectorized_model import VectorizedEconomicModel, ArrayDataCollector
+from kernel import KernelEconomicModel
+
+# phase name -> (class, method) timed by PhaseProfiler; 'step' is the whole model step, the other phases
+# are part of it, and look_for_crimes includes arrest
+PHASES = {
+    'step': (EconomicModel, 'step'),
+    'shuffle': (JailActivation, 'shuffle'),
+    'move': (EconomicAgent, 'move'),
+    'choose_partner': (EconomicAgent, 'choose_partner'),
+    'decide_action': (EconomicAgent, 'decide_action'),
+    'steal': (EconomicAgent, 'steal'),
+    'make_trade': (EconomicAgent, 'make_trade'),
+    'check_for_crimes': (EconomicAgent, 'check_for_crimes'),
+    'pay_tax': (EconomicAgent, 'pay_tax'),
+    'vote': (EconomicAgent, 'vote'),
+    'cop_move': (CopAgent, 'move'),
+    'look_for_crimes': (CopAgent, 'look_for_crimes'),
+    'arrest': (CopAgent, 'arrest'),
+    'election': (EconomicModel, 'hold_election'),
+    'collect': (PolicyDataCollector, 'collect'),
+    # the array models only have these phases, the agents are stepped inside the kernel
+    'array_step': (VectorizedEconomicModel, 'step'),
+    'kernel_step': (KernelEconomicModel, 'step'),
+    'array_election': (VectorizedEconomicModel, 'hold_election'),
+    'array_collect': (ArrayDataCollector, 'collect'),
+}
+
+class PhaseProfiler:
+    """
+    Opt-in wall time and call counts of the phases of a model step, see PHASES.
+
+    Used as a context manager: on entering, the methods in PHASES are replaced on their classes by timed
+    wrappers, and on exiting the original methods are put back. Without a profiler nothing is wrapped, so
+    a run that is not profiled pays nothing at all. The wrappers are per class, so only one model should
+    run in the process while a profiler is active, which is the case in the experiment workers.
+    Times are inclusive: a phase that calls another phase includes its time.
+    """
+    def __init__(self):
+        self.stats = {phase: [0, 0.0] for phase in PHASES} # phase -> [calls, seconds]
+        self._originals = {}
+
+    def _wrap(self, phase, method):
+        stats = self.stats[phase]
+        perf_counter = time.perf_counter
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats[0] += 1
+                stats[1] += perf_counter() - start
+        return timed
+
+    def __enter__(self):
+        for phase, (cls, name) in PHASES.items():
+            method = cls.__dict__[name]
+            self._originals[phase] = method
+            setattr(cls, name, self._wrap(phase, method))
+        return self
+
+    def __exit__(self, *exc):
+        for phase, (cls, name) in PHASES.items():
+            setattr(cls, name, self._originals.pop(phase))
+        return False
+
+    def table(self):
+        """The phases that were called, with their calls and seconds."""
+        return pd.DataFrame([{'phase': phase, 'calls': calls, 'seconds': seconds} for phase, (calls, seconds) in self.stats.items() if calls],
+                            columns=['phase', 'calls', 'seconds'])
+
+def summarize(tables):
+    """
+    Aggregate per-run profile tables, e.g. of all workers of an experiment.
+
+    Parameters:
+    - tables (pd.DataFrame): The tables of PhaseProfiler.table stacked, e.g. read with results_io.load_results.
+
+    Returns:
+    - pd.DataFrame: calls, seconds, microseconds per call and share of the step time of every phase, slowest first.
+    """
+    summary = tables.groupby('phase')[['calls', 'seconds']].sum()
+    summary['us_per_call'] = 1e6 * summary['seconds'] / summary['calls']
+    step_seconds = summary.loc[summary.index.isin(['step', 'array_step', 'kernel_step']), 'seconds'].max()
+    summary['share'] = summary['seconds'] / step_seconds
+    return summary.sort_values('seconds', ascending=False).reset_index()
@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+from model import EconomicModel
+from kernel import (jit, step_kernel, KernelEconomicModel, NUMBA_AVAILABLE,
+                    CRIMES, STOLEN, TRADE_INCOME, ARRESTS, TAX_PAID, VOTES)
+from rng import run_seed
+from run_cache import config_id
+
+# model reporters along the last axis of ReplicateBatch.history, in EconomicModel's order
+METRICS = ['num_cops', 'num_crimes_committed', 'num_arrests_made', 'tax_rate', 'total_stolen', 'total_trade_income',
+           'avg_wealth', 'total_wealth', 'avg_crime_perception', 'vote_outcome', 'gini_coeff']
+
+@jit
+def batch_step_kernel(order, lengths, u_move, u_pick, steps, width, height, prosperity, sentence_length, tax_rate, election_frequency, interaction_memory,
+                      x, y, cop_x, cop_y, cell_head, next_in_cell, prev_in_cell, crimes_in_cell, scratch,
+                      wealth, trading_skill, risk_aversion, num_interactions, num_crimes_witnessed, num_been_crimed,
+                      total_trading_gain, total_stealing_gain, crimes_committed_agent, amount_arrested,
+                      has_traded, has_crime, is_arrested, time_until_released, q_values, q_head, q_count, q_total):
+    """
+    step_kernel for every replicate, the first axis of every state array.
+
+    order, u_move and u_pick hold the draws of each replicate in a row, order[r, :lengths[r]] being the
+    activation order of replicate r. tax_rate has one rate per replicate. Returns the totals of step_kernel
+    with one row per replicate.
+    """
+    totals = np.empty((x.shape[0], 6))
+    for r in range(x.shape[0]):
+        m = lengths[r]
+        totals[r] = step_kernel(order[r, :m], u_move[r, :m], u_pick[r], steps, width, height, prosperity, sentence_length, tax_rate[r], election_frequency, interaction_memory,
+                                x[r], y[r], cop_x[r], cop_y[r], cell_head[r], next_in_cell[r], prev_in_cell[r], crimes_in_cell[r], scratch,
+                                wealth[r], trading_skill[r], risk_aversion[r], num_interactions[r], num_crimes_witnessed[r], num_been_crimed[r],
+                                total_trading_gain[r], total_stealing_gain[r], crimes_committed_agent[r], amount_arrested[r],
+                                has_traded[r], has_crime[r], is_arrested[r], time_until_released[r],
+                                (q_values[0][r], q_values[1][r], q_values[2][r]), (q_head[0][r], q_head[1][r], q_head[2][r]),
+                                (q_count[0][r], q_count[1][r], q_count[2][r]), (q_total[0][r], q_total[1][r], q_total[2][r]))
+    return totals
+
+class ReplicateBatch:
+    """
+    R replicates of one parameter set, advanced together.
+
+    Every replicate starts as a KernelEconomicModel with its own seed, after which its state is stacked
+    into arrays with a leading replicate axis. Each step draws the random numbers of every replicate from
+    that replicate's own generator, runs all replicates in one call to batch_step_kernel and computes the
+    model reporters with NumPy over the replicate axis, so the per-step Python work is shared by all
+    replicates. Replicate r follows exactly the same path as KernelEconomicModel(seed=seeds[r]).
+
+    The model reporters are kept in history, a (replicate x step x metric) array with the metrics in
+    METRICS order; to_frame turns it into the long DataFrame plot.plot_ofat expects.
+
+    Parameters:
+    - params (dict): EconomicModel parameters.
+    - seeds (list): One seed per replicate.
+    - max_steps (int): Number of steps history has room for, it grows when more steps are run.
+    """
+    def __init__(self, params, seeds, max_steps=1000):
+        self.params = dict(params)
+        models = [KernelEconomicModel(**params, seed=seed, collect_model='never', collect_agents='never') for seed in seeds]
+        first = models[0]
+        self.replicates = len(models)
+        self.num_agents = first.num_agents
+        self.width, self.height = first.width, first.height
+        self.prosperity = first.prosperity
+        self.sentence_length = first.sentence_length
+        self.election_frequency = first.election_frequency
+        self.interaction_memory = first.interaction_memory
+        self.tax_per_cop = first.tax_per_cop
+        self.rngs = [model.rng for model in models]
+        self.steps = 0
+
+        def stack(name):
+            return np.stack([getattr(model, name) for model in models])
+
+        self.x, self.y = stack('x'), stack('y')
+        self.cell_head, self.next_in_cell, self.prev_in_cell = stack('cell_head'), stack('next_in_cell'), stack('prev_in_cell')
+        self.crimes_in_cell = stack('crimes_in_cell')
+        self._scratch = np.empty(self.num_agents, dtype=np.int64)
+        for name in ('wealth', 'trading_skill', 'risk_aversion', 'num_interactions', 'num_crimes_witnessed', 'num_been_crimed',
+                     'total_trading_gain', 'total_stealing_gain', 'crimes_committed_agent', 'amount_arrested',
+                     'has_traded_this_turn', 'has_committed_crime_this_turn', 'is_arrested', 'time_until_released'):
+            setattr(self, name, stack(name))
+        queues = [(model.q_incomes, model.q_crime_perception, model.q_interactions) for model in models]
+        self.q_values, self.q_head, self.q_count, self.q_total = (
+            tuple(np.stack([getattr(qs[k], field) for qs in queues]) for k in range(3))
+            for field in ('values', 'head', 'count', 'total'))
+
+        # cops sit in the first num_cops_placed columns, oldest first like in VectorizedEconomicModel
+        self.num_cops_placed = np.array([model.num_cops_placed for model in models])
+        self.cop_x = np.zeros((self.replicates, max(1, self.num_cops_placed.max())), dtype=np.int64)
+        self.cop_y = np.zeros_like(self.cop_x)
+        for r, model in enumerate(models):
+            self.cop_x[r, :model.num_cops_placed] = model.cop_x
+            self.cop_y[r, :model.num_cops_placed] = model.cop_y
+
+        self.num_cops = np.array([model.num_cops for model in models])
+        self.tax_rate = np.array([model.tax_rate for model in models], dtype=float)
+        self.votes = np.zeros(self.replicates, dtype=np.int64)
+        self.num_crimes_committed = np.zeros(self.replicates, dtype=np.int64)
+        self.num_arrests_made = np.zeros(self.replicates, dtype=np.int64)
+        self.total_stolen = np.zeros(self.replicates)
+        self.total_trade_income = np.zeros(self.replicates)
+        self.total_tax_paid = np.zeros(self.replicates)
+
+        self.history = np.empty((self.replicates, max_steps, len(METRICS)))
+
+    def step(self):
+        """Advance every replicate by one step, see KernelEconomicModel.step."""
+        self.steps += 1
+        n = self.num_agents
+        lengths = n + self.num_cops_placed
+        order = np.zeros((self.replicates, lengths.max()), dtype=np.int64)
+        u_move = np.zeros((self.replicates, lengths.max()))
+        u_pick = np.empty((self.replicates, n))
+        for r, rng in enumerate(self.rngs):
+            # the same draws in the same order as KernelEconomicModel.step
+            order[r, :lengths[r]] = rng.permutation(lengths[r])
+            u_move[r, :lengths[r]] = rng.random(lengths[r])
+            u_pick[r] = rng.random(n)
+
+        totals = batch_step_kernel(
+            order, lengths, u_move, u_pick, self.steps, self.width, self.height,
+            self.prosperity, self.sentence_length, self.tax_rate, self.election_frequency, self.interaction_memory,
+            self.x, self.y, self.cop_x, self.cop_y, self.cell_head, self.next_in_cell, self.prev_in_cell, self.crimes_in_cell, self._scratch,
+            self.wealth, self.trading_skill, self.risk_aversion, self.num_interactions, self.num_crimes_witnessed, self.num_been_crimed,
+            self.total_trading_gain, self.total_stealing_gain, self.crimes_committed_agent, self.amount_arrested,
+            self.has_traded_this_turn, self.has_committed_crime_this_turn, self.is_arrested, self.time_until_released,
+            self.q_values, self.q_head, self.q_count, self.q_total)
+
+        self.num_crimes_committed += totals[:, CRIMES].astype(np.int64)
+        self.total_stolen += totals[:, STOLEN]
+        self.total_trade_income += totals[:, TRADE_INCOME]
+        self.num_arrests_made += totals[:, ARRESTS].astype(np.int64)
+        self.total_tax_paid += totals[:, TAX_PAID]
+        self.votes += totals[:, VOTES].astype(np.int64)
+
+        if self.steps % self.interaction_memory == 0:
+            for values, total in zip(self.q_values, self.q_total):
+                total[:] = values.sum(axis=2)
+
+        self.hold_election()
+        self.record()
+
+    def hold_election(self):
+        """Adjust the tax rate and the cops of every replicate to its votes, see VectorizedEconomicModel.hold_election."""
+        if not ((self.steps - 1) % self.election_frequency == 0 and self.steps != 1):
+            return
+        for r, rng in enumerate(self.rngs):
+            if self.votes[r] > 0:
+                self.tax_rate[r] += self.tax_per_cop
+            elif self.tax_rate[r] > 0:
+                self.tax_rate[r] -= self.tax_per_cop
+
+            self.num_cops[r] = int(self.tax_rate[r] / self.tax_per_cop)
+            placed = self.num_cops_placed[r]
+            if placed < self.num_cops[r]:
+                if placed == self.cop_x.shape[1]:
+                    self.cop_x = np.pad(self.cop_x, ((0, 0), (0, placed)))
+                    self.cop_y = np.pad(self.cop_y, ((0, 0), (0, placed)))
+                self.cop_x[r, placed] = rng.integers(0, self.width)
+                self.cop_y[r, placed] = rng.integers(0, self.height)
+                self.num_cops_placed[r] += 1
+            elif placed > self.num_cops[r] and placed > 0:
+                # the oldest cop leaves
+                self.cop_x[r, :placed - 1] = self.cop_x[r, 1:placed]
+                self.cop_y[r, :placed - 1] = self.cop_y[r, 1:placed]
+                self.num_cops_placed[r] -= 1
+        self.votes[:] = 0
+
+    def record(self):
+        """Write the model reporters of every replicate for the current step into history."""
+        if self.steps > self.history.shape[1]:
+            self.history = np.concatenate([self.history, np.empty_like(self.history)], axis=1)
+        counts = self.q_count[1]
+        perception = np.divide(self.q_total[1], counts, out=np.zeros_like(self.q_total[1]), where=counts > 0)
+        N = self.num_agents
+        x = np.sort(self.wealth, axis=1)
+        B = np.sum(x * (N - np.arange(N)), axis=1) / (N * x.sum(axis=1))
+        row = self.history[:, self.steps - 1]
+        row[:, 0] = self.num_cops
+        row[:, 1] = self.num_crimes_committed
+        row[:, 2] = self.num_arrests_made
+        row[:, 3] = self.tax_rate
+        row[:, 4] = self.total_stolen
+        row[:, 5] = self.total_trade_income
+        row[:, 6] = self.wealth.mean(axis=1)
+        row[:, 7] = self.wealth.sum(axis=1)
+        row[:, 8] = perception.mean(axis=1)
+        row[:, 9] = self.votes
+        row[:, 10] = 1 + (1 / N) - 2 * B
+
+    def run(self, steps):
+        """Run steps more steps and return the (replicate x step x metric) history of all steps so far."""
+        for _ in range(steps):
+            self.step()
+        return self.history[:, :self.steps]
+
+def run_replicates(params, replicates, max_steps, seed=None, use_kernel=True):
+    """
+    Run replicates of one parameter set for max_steps steps.
+
+    Replicate i gets the seed experiment.run gives iteration i of params. Without Numba (or with use_kernel
+    False) the replicates run one after the other as EconomicModels. Those draw their random numbers
+    differently, so the array is statistically equivalent, not equal; only ReplicateBatch and
+    KernelEconomicModel match bit for bit.
+
+    Parameters:
+    - params (dict): EconomicModel parameters.
+    - replicates (int): Number of replicates.
+    - max_steps (int): Number of steps.
+    - seed (int or None): Base seed, as in config.toml [simulation].
+    - use_kernel (bool): Run the replicates together in a ReplicateBatch.
+
+    Returns:
+    - np.ndarray: The model reporters, shaped (replicate x step x metric) with the metrics in METRICS order.
+    """
+    seeds = [run_seed(seed, config_id(params), i) for i in range(replicates)]
+    if use_kernel and NUMBA_AVAILABLE:
+        return ReplicateBatch(params, seeds, max_steps).run(max_steps)
+    history = []
+    for replicate_seed in seeds:
+        model = EconomicModel(**params, seed=replicate_seed, collect_agents='never')
+        for _ in range(max_steps):
+            model.step()
+        history.append(model.datacollector.get_model_vars_dataframe()[METRICS].to_numpy(dtype=float))
+    return np.stack(history)
+
+def to_frame(history, params):
+    """
+    Long DataFrame of a (replicate x step x metric) array, with the Step, iteration and parameter columns
+    of experiment.py's results, so it can go straight into plot.plot_ofat.
+
+    Parameters:
+    - history (np.ndarray): Model reporters shaped (replicate x step x metric), metrics in METRICS order.
+    - params (dict): Parameter values of the replicates.
+
+    Returns:
+    - pd.DataFrame: One row per replicate and step.
+    """
+    replicates, steps, _ = history.shape
+    data = pd.DataFrame(history.reshape(-1, len(METRICS)), columns=METRICS)
+    data.insert(0, 'Step', np.tile(np.arange(1, steps + 1), replicates))
+    data['iteration'] = np.repeat(np.arange(1, replicates + 1), steps)
+    for key, value in params.items():
+        data[key] = value
+    return data
@@ -0,0 +1,187 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+
+class ShardSink:
+    """
+    Append-only store of result tables on disk.
+
+    Every finished run (or any other DataFrame) is written as one shard, a .npy file holding the table as a
+    NumPy structured array with one field per column, so workers can write their own results as they finish
+    and nothing has to be gathered in memory. Reading a shard back costs one small header parse however many
+    columns it has. Shards are written to a temporary file and renamed, so readers never see half a shard.
+    Read them back with load_results or iter_results.
+
+    Parameters:
+    - path (str): Directory of the shards, created if needed. It is made absolute, so task queue workers
+      started in other directories write to the same place.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        os.makedirs(self.path, exist_ok=True)
+
+    def write(self, df, name):
+        """Write df as the shard called name, replacing an existing shard of that name."""
+        columns = [_column_array(df[column]) for column in df.columns]
+        table = np.rec.fromarrays(columns, names=[str(column) for column in df.columns]) if columns else np.empty(0)
+        file = os.path.join(self.path, name + '.npy')
+        tmp = file + '.tmp'
+        with open(tmp, 'wb') as f:
+            # format 3.0 skips the slow Python 2 compatibility pass over the header when reading
+            np.lib.format.write_array(f, table.view(np.ndarray), version=(3, 0), allow_pickle=False)
+        os.replace(tmp, file)
+
+    def shards(self):
+        """Paths of the shards, in name order."""
+        return sorted(glob.glob(os.path.join(self.path, '*.npy')))
+
+    def clear(self):
+        """Delete all shards."""
+        for file in self.shards():
+            os.remove(file)
+
+def _column_array(series):
+    if series.dtype == object:
+        # mixed or string columns are stored as unicode so no pickling is needed to read them
+        return series.astype(str).to_numpy(dtype=str)
+    return series.to_numpy()
+
+def _read_shard(file, columns, steps):
+    # memory-mapped, so only the selected columns and rows are read from disk
+    table = np.load(file, mmap_mode='r', allow_pickle=False)
+    names = table.dtype.names if columns is None else columns
+    if steps is not None:
+        rows = np.flatnonzero(np.isin(table['Step'], steps))
+        return {name: table[name][rows] for name in names}
+    return {name: np.array(table[name]) for name in names}
+
+def iter_results(path, columns=None, steps=None):
+    """
+    Read the shards in a ShardSink directory one at a time.
+
+    Parameters:
+    - path (str): Directory of the shards.
+    - columns (list): Columns to keep, all by default.
+    - steps (int or list): Only keep the rows with these values in the 'Step' column.
+
+    Yields:
+    - pd.DataFrame: The selected rows and columns of one shard.
+    """
+    if steps is not None:
+        steps = np.atleast_1d(steps)
+    for file in ShardSink(path).shards():
+        yield pd.DataFrame(_read_shard(file, columns, steps))
+
+def load_results(path, columns=None, steps=None):
+    """
+    Read the shards in a ShardSink directory into one DataFrame.
+
+    Parameters:
+    - path (str): Directory of the shards.
+    - columns (list): Columns to keep, all by default.
+    - steps (int or list): Only keep the rows with these values in the 'Step' column.
+
+    Returns:
+    - pd.DataFrame: The selected rows and columns of all shards.
+    """
+    if steps is not None:
+        steps = np.atleast_1d(steps)
+    parts = {}
+    for file in ShardSink(path).shards():
+        for name, values in _read_shard(file, columns, steps).items():
+            parts.setdefault(name, []).append(values)
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    # one concatenation per column is much cheaper than concatenating a DataFrame per shard
+    return pd.DataFrame({name: np.concatenate(values) for name, values in parts.items()})
+
+def compact(df):
+    """
+    Copy of df with 64-bit float and integer columns stored as float32 and int32 where their values fit.
+
+    Columns with values beyond the range of the smaller type stay 64-bit: wealth reporters reach about 3e150,
+    which float32 would silently turn into inf.
+    """
+    dtypes = {}
+    for column, dtype in df.dtypes.items():
+        values = df[column].to_numpy()
+        if dtype == np.float64:
+            largest = np.abs(values[np.isfinite(values)]).max(initial=0)
+            if largest < np.finfo(np.float32).max:
+                dtypes[column] = np.float32
+        elif dtype == np.int64:
+            info = np.iinfo(np.int32)
+            if len(values) == 0 or (info.min <= values.min() and values.max() <= info.max):
+                dtypes[column] = np.int32
+    return df.astype(dtypes)
+
+class RunSink:
+    """
+    Normalized store of model results, split into a runs table and a steps table.
+
+    The runs table has one row per run: run_id, the parameter values and run information such as the
+    iteration, seed and wall time. The steps table has run_id, Step and the model reporters, as float32/int32
+    where their values fit (see compact), so the parameters are stored once per run instead of once per step. Both tables are ShardSinks with
+    one shard per run, under path/runs and path/steps. Read them back as the usual wide frame with
+    load_runs, or as separate tables with load_results and join them with join_runs.
+
+    Parameters:
+    - path (str): Directory of the two tables, created if needed, made absolute like ShardSink's.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.runs = ShardSink(os.path.join(self.path, 'runs'))
+        self.steps = ShardSink(os.path.join(self.path, 'steps'))
+
+    def write(self, model_results, run_id, params, **run_info):
+        """
+        Write one run.
+
+        Parameters:
+        - model_results (pd.DataFrame): The model reporters of the run, without parameter columns.
+        - run_id (int): Id of the run, unique within the sink.
+        - params (dict): Parameter values of the run.
+        - run_info: Other values stored in the runs table, e.g. iteration, seed and wall_time.
+        """
+        name = f'{run_id:08d}'
+        run = {'run_id': run_id, **params, **{key: -1 if value is None else value for key, value in run_info.items()}}
+        self.runs.write(pd.DataFrame([run]), name)
+        steps = compact(model_results)
+        steps.insert(0, 'run_id', np.int32(run_id))
+        self.steps.write(steps, name)
+
+    def clear(self):
+        """Delete both tables."""
+        self.runs.clear()
+        self.steps.clear()
+
+def join_runs(runs, steps):
+    """
+    Join a runs table onto a steps table, giving the wide frame with the parameters repeated in every row
+    that plot.plot_ofat and the notebooks expect.
+
+    Parameters:
+    - runs (pd.DataFrame): The runs table.
+    - steps (pd.DataFrame): The steps table.
+
+    Returns:
+    - pd.DataFrame: One row per step, with the steps columns followed by the runs columns.
+    """
+    return steps.merge(runs, on='run_id', how='left', sort=False)
+
+def load_runs(path, columns=None, steps=None):
+    """
+    Read a RunSink directory as one wide frame, see join_runs.
+
+    Parameters:
+    - path (str): Directory of the RunSink.
+    - columns (list): Columns of the steps table to read, all by default.
+    - steps (int or list): Only keep these steps.
+
+    Returns:
+    - pd.DataFrame: The selected steps joined with their runs.
+    """
+    if columns is not None and 'run_id' not in columns:
+        columns = ['run_id', *columns]
+    return join_runs(load_results(os.path.join(path, 'runs')), load_results(os.path.join(path, 'steps'), columns, steps))
@@ -0,0 +1,71 @@
+import math
+
+class RingBuffer:
+    """
+    Fixed-capacity FIFO queue of numbers that keeps a running sum of its contents.
+
+    Appending to a full buffer evicts the oldest value, the same as a deque with maxlen, so
+    sum(), mean() and len() are O(1) instead of a pass over the whole queue. Float sums are
+    recomputed exactly every `capacity` evictions so rounding errors cannot build up over a long run.
+
+    Parameters:
+    - capacity (int): Maximum number of values kept.
+    - iterable (iterable): Initial values, oldest first.
+    """
+    __slots__ = ('capacity', '_values', '_head', '_size', '_sum', '_evictions')
+
+    def __init__(self, capacity, iterable=()):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._values = [] # grows up to capacity, then wraps around
+        self._head = 0 # position of the oldest value, stays 0 until the buffer is full
+        self._size = 0
+        self._sum = 0
+        self._evictions = 0
+        self.extend(iterable)
+
+    def append(self, value):
+        """Add a value, evicting the oldest one if the buffer is full."""
+        capacity = self.capacity
+        if self._size < capacity:
+            self._values.append(value)
+            self._size += 1
+            self._sum += value
+            return
+
+        head = self._head
+        self._sum += value - self._values[head]
+        self._values[head] = value
+        self._head = (head + 1) % capacity
+        self._evictions += 1
+        if self._evictions == capacity:
+            self._evictions = 0
+            if isinstance(self._sum, float):
+                self._sum = math.fsum(self._values)
+
+    def extend(self, iterable):
+        """Append every value of iterable in order."""
+        for value in iterable:
+            self.append(value)
+
+    def sum(self):
+        """Sum of the values in the buffer."""
+        return self._sum
+
+    def mean(self):
+        """Mean of the values in the buffer, raises ValueError when it is empty."""
+        if self._size == 0:
+            raise ValueError("mean of an empty RingBuffer")
+        return self._sum / self._size
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        values, head, capacity = self._values, self._head, self.capacity
+        for i in range(self._size):
+            yield values[(head + i) % capacity]
+
+    def __repr__(self):
+        return f"RingBuffer({list(self)}, capacity={self.capacity})"
@@ -0,0 +1,68 @@
+import numpy as np
+
+class BlockStream:
+    """
+    Random numbers served one at a time from blocks pre-drawn with a numpy.random.Generator.
+
+    Drawing a few thousand numbers in one call and handing them out as Python floats is much cheaper than
+    one RNG call per agent decision.
+
+    Parameters:
+    - generator (numpy.random.Generator): The generator the blocks are drawn from.
+    - block_size (int): How many numbers are drawn at once.
+    """
+    def __init__(self, generator, block_size=1024):
+        self.generator = generator
+        self.block_size = block_size
+        self._uniforms = []
+        self._normals = []
+
+    def random(self):
+        """A uniform float in [0, 1)."""
+        if not self._uniforms:
+            self._uniforms = self.generator.random(self.block_size).tolist()
+        return self._uniforms.pop()
+
+    def index(self, n):
+        """A uniform integer in [0, n)."""
+        return int(self.random() * n)
+
+    def choice(self, seq):
+        """A uniformly chosen element of a non-empty sequence."""
+        return seq[int(self.random() * len(seq))]
+
+    def uniform(self, low, high):
+        return low + (high - low) * self.random()
+
+    def normal(self, mean, std):
+        if not self._normals:
+            self._normals = self.generator.standard_normal(self.block_size).tolist()
+        return mean + std * self._normals.pop()
+
+class RandomStreams:
+    """
+    The random number streams of one model run.
+
+    Moves, partner picks and initial agent attributes each get their own BlockStream, drawn from independent
+    generators spawned from one seed, so a model run is reproducible from its seed alone (also inside joblib
+    workers) and a change in how often one kind of number is drawn does not shift the others.
+
+    Parameters:
+    - seed (int or None): Seed of the streams, None draws fresh entropy from the OS.
+    - block_size (int): How many numbers each stream pre-draws at once.
+    """
+    def __init__(self, seed=None, block_size=1024):
+        self.seed = seed
+        moves, partners, attributes = np.random.SeedSequence(seed).spawn(3)
+        self.moves = BlockStream(np.random.default_rng(moves), block_size)
+        self.partners = BlockStream(np.random.default_rng(partners), block_size)
+        self.attributes = BlockStream(np.random.default_rng(attributes), block_size)
+
+def run_seed(base_seed, *keys):
+    """
+    Seed of one run of an experiment, derived from the experiment's base seed and keys such as
+    the parameter set and iteration numbers. Returns None (an unseeded run) if base_seed is None.
+    """
+    if base_seed is None:
+        return None
+    return int(np.random.SeedSequence([base_seed, *keys]).generate_state(1)[0])
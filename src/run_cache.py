@@ -0,0 +1,220 @@
+import os
+import time
+import glob
+import json
+import pickle
+import hashlib
+from functools import lru_cache
+from contextlib import nullcontext
+from kernel import make_model
+from convergence import ConvergenceMonitor
+from profiler import PhaseProfiler
+from snapshot import FORKABLE, fork, read
+
+# parameters the model only uses as whole numbers, so e.g. Saltelli samples 20.3 and 20.7 of sentence_length are the same run
+INT_PARAMS = ['num_econ_agents', 'initial_cops', 'width', 'height', 'election_frequency', 'sentence_length', 'interaction_memory']
+
+# modules whose code changes the results of a run; editing any other module (plotting, benchmarks, the
+# experiment scripts) keeps the cached runs
+SIMULATION_MODULES = ['model', 'agent', 'schedule', 'kernel', 'vectorized_model', 'rng', 'space', 'collection', 'aggregates', 'ring_buffer',
+                      'convergence', 'snapshot']
+
+def canonical_params(params):
+    """Parameter values as the model sees them, as plain ints and floats in name order."""
+    return {key: int(value) if key in INT_PARAMS else float(value) for key, value in sorted(params.items())}
+
+def config_id(params):
+    """32-bit id of a parameter configuration, equal for parameters with equal canonical_params."""
+    digest = hashlib.sha256(json.dumps(canonical_params(params)).encode()).digest()
+    return int.from_bytes(digest[:4], 'little')
+
+@lru_cache(maxsize=None)
+def code_version():
+    """Hash of the SIMULATION_MODULES, so any change to the simulation code invalidates the cached runs."""
+    sha = hashlib.sha256()
+    for module in sorted(SIMULATION_MODULES):
+        file = os.path.join(os.path.dirname(os.path.abspath(__file__)), module + '.py')
+        sha.update(os.path.basename(file).encode())
+        with open(file, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:16]
+
+def run_key(params, seed, max_steps, **settings):
+    """
+    Key of one model run in a RunCache.
+
+    Parameters:
+    - params (dict): Parameter values of the run.
+    - seed (int): Seed of the run.
+    - max_steps (int): Number of steps of the run.
+    - settings: Anything else that changes the results, e.g. use_kernel or the collection policies.
+
+    Returns:
+    - str: Hex digest of the canonical parameters, seed, max_steps, settings and code_version.
+    """
+    content = {'params': canonical_params(params), 'seed': seed, 'max_steps': max_steps,
+               'settings': {key: settings[key] for key in sorted(settings)}, 'code': code_version()}
+    return hashlib.sha256(json.dumps(content, default=str).encode()).hexdigest()
+
+class RunCache:
+    """
+    On-disk cache of finished model runs, addressed by run_key.
+
+    Every run is one pickle file named after its key, written to a temporary file and renamed, so several
+    workers can share the cache and a run killed halfway leaves nothing behind. Rerunning an interrupted
+    sweep with the same cache only simulates the runs that are missing. With max_bytes, the least recently
+    used runs are deleted once the cache grows beyond it. Every instance keeps a running estimate of the
+    size, updated on put and evict, so the directory is only scanned when the estimate passes max_bytes
+    (it is then evicted down to 90% of max_bytes) or every RESCAN puts, to also see the runs other workers wrote.
+
+    Parameters:
+    - path (str): Directory of the cache, created if needed. It is made absolute, so task queue workers
+      started in other directories share it.
+    - max_bytes (int or None): Size limit of the cache, None for no limit.
+    """
+    RESCAN = 64
+
+    def __init__(self, path, max_bytes=None):
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self._bytes = None # running size estimate, None until the first scan
+        self._puts = 0
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    def get(self, key):
+        """The cached value of key, or None if it is not cached."""
+        file = self._file(key)
+        try:
+            with open(file, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(file) # mark as recently used for eviction
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def put(self, key, value):
+        """Cache value under key, then evict old runs if the cache is over its size limit."""
+        file = self._file(key)
+        tmp = f'{file}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp)
+        os.replace(tmp, file)
+        if self.max_bytes is None:
+            return
+        self._puts += 1
+        if self._bytes is not None:
+            self._bytes += size
+        if self._bytes is None or self._bytes > self.max_bytes or self._puts % self.RESCAN == 0:
+            # evicting a bit more than needed leaves room for the next puts before the next scan
+            self.evict(int(self.max_bytes * 0.9) if self._bytes is not None and self._bytes > self.max_bytes else self.max_bytes)
+
+    def evict(self, max_bytes):
+        """Delete the least recently used runs until the cache takes at most max_bytes."""
+        entries = []
+        for file in glob.glob(os.path.join(self.path, '*.pkl')):
+            try:
+                stat = os.stat(file)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file))
+        total = sum(size for _, size, _ in entries)
+        for _, size, file in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass # another worker evicted it first
+            total -= size
+        self._bytes = total
+
+    def size(self):
+        """Total size of the cached runs in bytes."""
+        return sum(os.path.getsize(file) for file in glob.glob(os.path.join(self.path, '*.pkl')))
+
+    def clear(self):
+        """Delete all cached runs."""
+        self.evict(0)
+
+def split_duplicates(tasks, key):
+    """
+    Split tasks into the first task of every key and the remaining duplicates, both in their original order.
+
+    Running the first list before the second lets every duplicate find its run in the cache instead of
+    being simulated at the same time in another worker.
+    """
+    seen = set()
+    unique, duplicates = [], []
+    for task in tasks:
+        k = key(task)
+        (duplicates if k in seen else unique).append(task)
+        seen.add(k)
+    return unique, duplicates
+
+def run_model(model_params, max_steps, seed=None, cache=None, use_kernel=False, collect_model='every', collect_agents='every', convergence=None, profile=False, start=None):
+    """
+    Run one model for max_steps steps, or fetch the run from cache if it was run before.
+
+    With convergence enabled the run stops as soon as a ConvergenceMonitor finds it stationary.
+    Unseeded runs are not reproducible and are never cached. Profiled runs are always simulated, as their
+    timings are what they are for, but are still cached for runs that are not profiled.
+
+    With start, the run forks from a burned-in model (see snapshot.burn_in) with the FORKABLE parameters of
+    model_params, and only runs the steps from the end of the burn-in to max_steps.
+
+    Parameters:
+    - model_params (dict): Keyword arguments of the model.
+    - max_steps (int): Number of steps.
+    - seed (int or None): Seed of the run.
+    - cache (RunCache or None): Cache to consult and fill.
+    - use_kernel (bool): Passed to kernel.make_model.
+    - collect_model (str): Collection policy of the model reporters.
+    - collect_agents (str): Collection policy of the agent reporters.
+    - convergence (dict or None): Settings of the ConvergenceMonitor, as in config.toml [convergence].
+    - profile (bool): Time the phases of every step with a PhaseProfiler.
+    - start (str or None): Path of the snapshot to fork from, its seed is the seed of the run.
+
+    Returns:
+    - tuple: The model and agent DataFrames of the DataCollector and a dict with the wall_time of the run in
+      seconds and, with convergence enabled, the last step (stop_step), whether the run stopped early at a
+      steady state (converged) and the final growth per step of the cumulative reporters, e.g.
+      num_crimes_committed_per_step. Profiled runs also have the PhaseProfiler table as profile.
+    """
+    monitor = ConvergenceMonitor.from_config(convergence)
+    key = None
+    if cache is not None and seed is not None:
+        key = run_key(model_params, seed, max_steps, use_kernel=use_kernel, collect_model=collect_model, collect_agents=collect_agents,
+                      convergence=None if monitor is None else monitor.settings(), start=start and os.path.basename(start))
+        cached = None if profile else cache.get(key)
+        if cached is not None:
+            return cached
+
+    profiler = PhaseProfiler() if profile else nullcontext()
+    started = time.perf_counter()
+    with profiler:
+        if start is None:
+            model = make_model(use_kernel, seed, **model_params, collect_model=collect_model, collect_agents=collect_agents)
+        else:
+            model = fork(read(start), **{name: model_params[name] for name in FORKABLE if name in model_params})
+        for _ in range(max_steps - model.steps):
+            model.step()
+            if monitor is not None and monitor.update(model):
+                break
+    info = {'wall_time': time.perf_counter() - started}
+    if monitor is not None:
+        info.update(stop_step=model.steps, converged=monitor.converged)
+        info.update({name + '_per_step': rate for name, rate in monitor.rates().items()})
+
+    result = (model.datacollector.get_model_vars_dataframe(), model.datacollector.get_agent_vars_dataframe(), info)
+    if key is not None:
+        cache.put(key, result)
+    if profile:
+        info['profile'] = profiler.table()
+    return result
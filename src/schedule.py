@@ -0,0 +1,159 @@
+import mesa
+
+class AgentRegistry:
+    """
+    Insertion-ordered registry of the model's agents, kept per agent type.
+
+    Looking up the agents of one type returns them directly, oldest first, instead of filtering
+    every agent with isinstance.
+    """
+    def __init__(self):
+        self._by_type = {} # agent type -> {agent: None}, dicts keep insertion order
+
+    def add(self, agent):
+        agents = self._by_type.setdefault(type(agent), {})
+        if agent in agents:
+            raise ValueError("agent already registered")
+        agents[agent] = None
+
+    def remove(self, agent):
+        del self._by_type[type(agent)][agent]
+
+    def of_type(self, agent_type):
+        """The registered agents of agent_type, oldest first."""
+        return list(self._by_type.get(agent_type, ()))
+
+    def count(self, agent_type):
+        return len(self._by_type.get(agent_type, ()))
+
+    def __contains__(self, agent):
+        return agent in self._by_type.get(type(agent), ())
+
+    def __iter__(self):
+        for agents in list(self._by_type.values()):
+            yield from list(agents)
+
+    def __len__(self):
+        return sum(len(agents) for agents in self._by_type.values())
+
+
+class JailCalendar:
+    """
+    Calendar of jailed economic agents, bucketed by the step in which they are released.
+
+    Adding an agent and popping the agents due in a step are O(1) per agent, no matter how many
+    agents are in jail or how long their sentences are.
+    """
+    def __init__(self):
+        self._buckets = {} # release step -> agents released in that step
+        self._jailed = {} # agent -> release step, in the order the agents were jailed
+
+    def add(self, agent, release_step):
+        """Jail an agent until release_step."""
+        self._buckets.setdefault(release_step, []).append(agent)
+        self._jailed[agent] = release_step
+
+    def pop_due(self, step):
+        """Remove and return the agents whose release step is step."""
+        agents = self._buckets.pop(step, [])
+        for agent in agents:
+            del self._jailed[agent]
+        return agents
+
+    def __len__(self):
+        return len(self._jailed)
+
+    def __iter__(self):
+        return iter(list(self._jailed))
+
+    def __contains__(self, agent):
+        return agent in self._jailed
+
+class JailActivation(mesa.time.BaseScheduler):
+    """
+    Random activation built on the model's AgentRegistry, which parks jailed economic agents outside the activation order.
+
+    Like RandomActivation, every step activates the scheduled agents once in a new random order, but the
+    order is one list of agents that is shuffled in place rather than a weakref set that is copied,
+    shuffled and rebuilt every step. Adding and removing agents also updates the registry, so the model
+    can look up its economic agents or cops without isinstance scans.
+
+    An agent arrested during a step is parked in the jail calendar at the end of that step, and put back
+    into the activation order at the start of the step in which its sentence runs out, so it is activated
+    and released in that step exactly as with RandomActivation. In the steps in between it is neither
+    shuffled nor activated: one pass over the calendar after the active agents have stepped calls
+    serve_sentence, which does what a jailed agent's step does (count down the sentence, pay the wealth tax
+    and vote). The step cost therefore grows with the number of free agents rather than all agents.
+
+    Parked agents are still part of `agents` and `get_agent_count`, so the DataCollector keeps recording them.
+
+    Parameters:
+    - model (mesa.Model): The model the schedule belongs to.
+    - registry (AgentRegistry): The registry to keep in sync with the schedule.
+    """
+    def __init__(self, model, registry):
+        super().__init__(model)
+        self.registry = registry
+        self.jail = JailCalendar()
+        self._order = [] # the agents activated every step, i.e. not parked in jail
+        self._arrested = []
+        self._agent_set = None # AgentSet of the registry, built on first use and dropped when agents change
+
+    def add(self, agent):
+        self.registry.add(agent)
+        self._order.append(agent)
+        self._agent_set = None
+
+    def remove(self, agent):
+        self.registry.remove(agent)
+        self._order.remove(agent)
+        self._agent_set = None
+
+    def note_arrest(self, agent):
+        """Called when an agent is arrested, it is parked once the current step is over."""
+        self._arrested.append(agent)
+
+    def step(self):
+        now = self.steps
+        self._order.extend(self.jail.pop_due(now))
+
+        self.shuffle()
+        for agent in self._order:
+            agent.step()
+        for agent in self.jail:
+            agent.serve_sentence()
+        self._park_arrested(now)
+
+        self.steps += 1
+        self.time += 1
+
+    def shuffle(self):
+        """Put the activation order in a new random order."""
+        self.model.random.shuffle(self._order)
+
+    def _park_arrested(self, now):
+        parked = False
+        for agent in self._arrested:
+            # with one step left the agent is released by its own step, so there is nothing to skip
+            if agent.is_arrested and agent.time_until_released > 1 and agent not in self.jail:
+                self.jail.add(agent, now + agent.time_until_released)
+                parked = True
+        if parked:
+            self._order = [agent for agent in self._order if agent not in self.jail]
+        self._arrested = []
+
+    def do_each(self, method, shuffle=False):
+        if shuffle:
+            self.model.random.shuffle(self._order)
+        for agent in list(self._order):
+            getattr(agent, method)()
+
+    def get_agent_count(self):
+        return len(self.registry)
+
+    @property
+    def agents(self):
+        """AgentSet of all agents, jailed ones included; the same set is returned until an agent is added or removed."""
+        if self._agent_set is None:
+            self._agent_set = mesa.agent.AgentSet(self.registry, self.model)
+        return self._agent_set
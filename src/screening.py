@@ -0,0 +1,126 @@
+import argparse
+import toml
+import numpy as np
+import pandas as pd
+from SALib.sample import morris as morris_sample
+from SALib.analyze import morris
+from rng import run_seed
+from run_cache import RunCache, INT_PARAMS, config_id
+from experiment import run_tasks
+from convergence import extrapolate_final
+from task_queue import task_queue
+
+def bounds_problem(bounds, names=None):
+    """SALib problem of the parameters in names (all of them by default) with their config.toml [bounds]."""
+    names = list(bounds) if names is None else list(names)
+    return {'num_vars': len(names), 'names': names, 'bounds': [list(bounds[name]) for name in names]}
+
+def design_params(problem, X, defaults):
+    """Model parameters of every row of the design X, with the parameters outside problem at their defaults."""
+    params_list = []
+    for row in X:
+        params = dict(defaults)
+        for name, value in zip(problem['names'], row):
+            params[name] = int(round(value)) if name in INT_PARAMS else float(value)
+        params_list.append(params)
+    return params_list
+
+def rank(problem, X, Y, num_levels=4, seed=None):
+    """
+    Elementary effects of every output, ranked.
+
+    mu_star and sigma are divided by the largest mu_star of their output, so outputs of very different
+    scales (total wealth and the number of cops) can be compared.
+
+    Parameters:
+    - problem (dict): SALib problem of the design.
+    - X (np.ndarray): The Morris design.
+    - Y (pd.DataFrame): One column per output, one row per row of X.
+    - num_levels (int): Number of levels of the design.
+    - seed (int or None): Seed of the bootstrap of mu_star_conf.
+
+    Returns:
+    - pd.DataFrame: output, parameter, mu, mu_star, mu_star_conf, sigma, relative_mu_star and relative_sigma,
+      sorted by output and decreasing mu_star.
+    """
+    tables = []
+    for output in Y.columns:
+        Si = morris.analyze(problem, X, Y[output].to_numpy(dtype=float), num_levels=num_levels, seed=seed)
+        table = pd.DataFrame({'output': output, 'parameter': problem['names'], 'mu': Si['mu'], 'mu_star': Si['mu_star'],
+                              'mu_star_conf': Si['mu_star_conf'], 'sigma': Si['sigma']})
+        scale = max(table['mu_star'].max(), 1e-12)
+        table['relative_mu_star'] = table['mu_star'] / scale
+        table['relative_sigma'] = table['sigma'] / scale
+        tables.append(table.sort_values('mu_star', ascending=False))
+    return pd.concat(tables, ignore_index=True)
+
+def influential(ranking, threshold=0.1, min_parameters=2):
+    """
+    Parameters whose relative mu_star or relative sigma reaches threshold for at least one output, most
+    influential first, topped up with the next most influential ones to at least min_parameters: a Sobol
+    analysis needs two parameters for its second-order indices.
+    """
+    score = ranking[['relative_mu_star', 'relative_sigma']].max(axis=1).groupby(ranking['parameter']).max().sort_values(ascending=False)
+    return list(score.index[:max((score >= threshold).sum(), min_parameters)])
+
+def screen(bounds, defaults, trajectories=20, num_levels=4, num_iterations=10, max_steps=500, outputs=('total_wealth', 'num_cops', 'num_crimes_committed'),
+           threshold=0.1, min_parameters=2, seed=42, use_kernel=False, cache=None, convergence=None, batch_size='auto', queue=None):
+    """
+    Morris screening of all bounded parameters.
+
+    A Morris design of `trajectories` trajectories over the parameters in bounds (trajectories * (parameters + 1)
+    configurations) is run num_iterations times in parallel, the final-step outputs are averaged over the
+    iterations, and the parameters are ranked by the mu_star and sigma of their elementary effects. The
+    ranking is written to results/morris_screening.csv.
+
+    Parameters:
+    - bounds (dict): Parameter bounds, as config.toml [bounds].
+    - defaults (dict): Values of the parameters that are not screened, as config.toml [defaults].
+    - threshold (float): See influential.
+    - min_parameters (int): See influential.
+    - seed (int or None): Seed of the design and of the runs.
+    - cache (RunCache or None): Run cache shared with the other experiments.
+    - queue (TaskQueue or None): Run on the workers of this task queue instead of joblib.
+
+    Returns:
+    - tuple: The ranking DataFrame (see rank) and the names of the influential parameters.
+    """
+    problem = bounds_problem(bounds)
+    X = morris_sample.sample(problem, trajectories, num_levels=num_levels, seed=seed)
+    params_list = design_params(problem, X, defaults)
+
+    tasks = [(p, params, i, run_seed(seed, config_id(params), i)) for p, params in enumerate(params_list) for i in range(num_iterations)]
+    # trajectories often meet at the same levels, the cache makes sure those configurations run once
+    results = run_tasks(tasks, batch_size, cache is not None and seed is not None, max_steps, False, num_iterations, use_kernel, 'final', 'never',
+                        None, cache, convergence, queue=queue)
+
+    last_rows = pd.DataFrame([dict(last, sample=p) for (p, _), (_, _, last) in results.items()])
+    outputs = list(outputs)
+    Y = extrapolate_final(last_rows, max_steps).groupby('sample')[outputs].mean().reindex(range(len(X)))
+    # cap extreme values like the Sobol stage does for total_wealth
+    Y = Y.clip(lower=-3e150, upper=3e150)
+
+    ranking = rank(problem, X, Y, num_levels, seed)
+    ranking.to_csv('results/morris_screening.csv', index=False)
+    return ranking, influential(ranking, threshold, min_parameters)
+
+def screen_config(config):
+    """Run screen with the settings of a loaded config.toml, see the [screening] table."""
+    settings = {key: value for key, value in config.get('screening', {}).items() if key != 'enabled'}
+    sim_settings = config['simulation']
+    cache = None
+    if sim_settings.get('cache_dir'):
+        cache_max_mb = sim_settings.get('cache_max_mb')
+        cache = RunCache(sim_settings['cache_dir'], None if cache_max_mb is None else int(cache_max_mb * 2**20))
+    return screen(config['bounds'], config['defaults'], seed=sim_settings.get('seed'), use_kernel=sim_settings.get('jit_kernel', False), cache=cache,
+                  convergence=config.get('convergence'), batch_size=sim_settings.get('batch_size', 'auto'),
+                  queue=task_queue(config.get('queue')), **settings)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Morris screening of the parameters in [bounds]:")
+    parser.add_argument('-c', '--config', type=str, default='config.toml', help='Path to the configuration file.')
+
+    args = parser.parse_args()
+    ranking, names = screen_config(toml.load(args.config))
+    print(ranking.to_string(index=False))
+    print(f"Influential parameters: {names}")
@@ -0,0 +1,101 @@
+import os
+import pickle
+from functools import lru_cache
+import numpy as np
+from joblib import Parallel, delayed
+from kernel import make_model
+from rng import RandomStreams
+
+# parameters a burned-in model can be forked with; the others shape the agents, the grid or the agents'
+# memories when the model is built, so changing them later would not give the model they describe
+FORKABLE = ['sentence_length', 'tax_per_cop', 'election_frequency']
+
+def snapshot(model):
+    """
+    The full state of a model as bytes: agents, grid positions, memory queues, counters, random number
+    generator states and DataCollector records. Works for EconomicModel and the array models.
+    """
+    return pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+
+def restore(data):
+    """The model saved by snapshot, continuing exactly where it was."""
+    return pickle.loads(data)
+
+def save(model, path):
+    """Write the snapshot of model to path, via a temporary file like RunCache."""
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(snapshot(model))
+    os.replace(tmp, path)
+
+@lru_cache(maxsize=4)
+def read(path):
+    """The snapshot saved at path, cached as a worker forks many runs from the same few burn-ins."""
+    with open(path, 'rb') as f:
+        return f.read()
+
+def fork(model, seed=None, **params):
+    """
+    Copy of a model with some parameters changed, to run on from the state of model.
+
+    Without seed the copy draws the same random numbers as model would (common random numbers), so forks
+    with different parameters differ only through the parameters. With seed its generators are seeded anew.
+
+    Changing tax_per_cop also sets the tax rate to what the current cops cost at the new rate. A new
+    sentence_length applies to arrests made after the fork.
+
+    Parameters:
+    - model: An EconomicModel or array model, or a snapshot of one (bytes).
+    - seed (int or None): New seed of the copy.
+    - params: New values of parameters in FORKABLE.
+
+    Returns:
+    - The copy.
+    """
+    unknown = set(params) - set(FORKABLE)
+    if unknown:
+        raise ValueError(f"cannot fork with {sorted(unknown)}, only {FORKABLE} can change after a burn-in")
+    model = restore(model if isinstance(model, bytes) else snapshot(model))
+    for name, value in params.items():
+        setattr(model, name, value)
+    if 'tax_per_cop' in params:
+        model.tax_rate = model.num_cops * model.tax_per_cop
+    if seed is not None:
+        if hasattr(model, 'streams'):
+            model.random.seed(seed)
+            model.streams = RandomStreams(model.random.getrandbits(64))
+        else:
+            model.rng = np.random.default_rng(seed)
+    return model
+
+def burn_in(model_params, steps, seed, path, use_kernel=False, collect_model='every', collect_agents='every'):
+    """
+    Run a model for steps steps and save it at path, unless path exists already.
+
+    Returns:
+    - str: path.
+    """
+    if not os.path.exists(path):
+        model = make_model(use_kernel, seed, **model_params, collect_model=collect_model, collect_agents=collect_agents)
+        for _ in range(steps):
+            model.step()
+        save(model, path)
+    return path
+
+def burn_in_all(model_params, steps, seeds, directory, n_jobs=-1, use_kernel=False, collect_model='every', collect_agents='every'):
+    """
+    burn_in for every seed in parallel, with the snapshots named by their run_cache.run_key in directory,
+    so burn-ins that were run before, e.g. by an interrupted sweep, are reused. The paths are absolute, so
+    task queue workers started in other directories find the snapshots.
+
+    Returns:
+    - list: The path of the snapshot of every seed.
+    """
+    from run_cache import run_key # run_cache imports this module
+    directory = os.path.abspath(directory)
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, run_key(model_params, seed, steps, burn_in=True, use_kernel=use_kernel, collect_model=collect_model,
+                                             collect_agents=collect_agents) + '.pkl') for seed in seeds]
+    Parallel(n_jobs=n_jobs)(delayed(burn_in)(model_params, steps, seed, path, use_kernel, collect_model, collect_agents)
+                            for seed, path in zip(seeds, paths) if not os.path.exists(path))
+    return paths
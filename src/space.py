@@ -0,0 +1,122 @@
+import mesa
+from agent import EconomicAgent, CopAgent
+
+class IndexedMultiGrid(mesa.space.MultiGrid):
+    """
+    MultiGrid with a per-cell occupancy index of the agents the model looks up every step.
+
+    For every cell the index holds the economic agents, the free (non-arrested) economic agents,
+    the cops, the economic agents that committed a crime this turn and the number of those crimes
+    within vision (radius 1, centre included) of the cell. It is updated whenever an agent is placed,
+    moved or removed, and by EconomicAgent whenever its is_arrested or has_committed_crime_this_turn
+    flag changes, so finding a partner or the crimes around a cell is a lookup instead of building
+    and filtering neighbour lists.
+    """
+    def __init__(self, width, height, torus):
+        super().__init__(width, height, torus)
+        self.econ = self._new_layer()
+        self.free = self._new_layer()
+        self.cops = self._new_layer()
+        self.criminals = self._new_layer()
+        self.crimes_in_view = [[0 for _ in range(self.height)] for _ in range(self.width)]
+        self._vision = {}
+
+    def _new_layer(self):
+        # dicts keep insertion order like the cell lists of MultiGrid, with O(1) removal
+        return [[{} for _ in range(self.height)] for _ in range(self.width)]
+
+    def _add_to_index(self, agent, x, y):
+        if isinstance(agent, EconomicAgent):
+            self.econ[x][y][agent] = None
+            if not agent.is_arrested:
+                self.free[x][y][agent] = None
+            if agent.has_committed_crime_this_turn:
+                self.criminals[x][y][agent] = None
+                self._count_crime((x, y), 1)
+        elif isinstance(agent, CopAgent):
+            self.cops[x][y][agent] = None
+
+    def _remove_from_index(self, agent, x, y):
+        if agent in self.criminals[x][y]:
+            del self.criminals[x][y][agent]
+            self._count_crime((x, y), -1)
+        for layer in (self.econ, self.free, self.cops):
+            layer[x][y].pop(agent, None)
+
+    def _count_crime(self, pos, change):
+        crimes_in_view = self.crimes_in_view
+        for x, y in self.vision(pos):
+            crimes_in_view[x][y] += change
+
+    def place_agent(self, agent, pos):
+        super().place_agent(agent, pos)
+        self._add_to_index(agent, *agent.pos)
+
+    def remove_agent(self, agent):
+        self._remove_from_index(agent, *agent.pos)
+        super().remove_agent(agent)
+
+    def move_agent(self, agent, pos):
+        if self._empties_built:
+            # keep MultiGrid's bookkeeping of empty cells, the index follows remove/place
+            super().move_agent(agent, pos)
+            return
+        pos = self.torus_adj(pos)
+        x, y = agent.pos
+        self._grid[x][y].remove(agent)
+        self._remove_from_index(agent, x, y)
+        x, y = pos
+        self._grid[x][y].append(agent)
+        agent.pos = pos
+        self._add_to_index(agent, x, y)
+
+    def set_free(self, agent, free):
+        """Record a change of an economic agent's arrest status."""
+        if agent.pos is None:
+            return
+        x, y = agent.pos
+        if free:
+            self.free[x][y][agent] = None
+        else:
+            self.free[x][y].pop(agent, None)
+
+    def set_criminal(self, agent, criminal):
+        """Record a change of an economic agent's has_committed_crime_this_turn flag."""
+        if agent.pos is None:
+            return
+        x, y = agent.pos
+        if criminal:
+            self.criminals[x][y][agent] = None
+            self._count_crime(agent.pos, 1)
+        elif agent in self.criminals[x][y]:
+            del self.criminals[x][y][agent]
+            self._count_crime(agent.pos, -1)
+
+    def vision(self, pos):
+        """The cells within radius 1 of pos, including pos itself."""
+        cells = self._vision.get(pos)
+        if cells is None:
+            cells = self._vision[pos] = self.get_neighborhood(pos, moore=True, include_center=True, radius=1)
+        return cells
+
+    def free_agents_at(self, pos):
+        """The free economic agents in the cell pos."""
+        x, y = pos
+        return self.free[x][y]
+
+    def count_crimes_near(self, pos):
+        """The number of economic agents within vision of pos that committed a crime this turn."""
+        x, y = pos
+        return self.crimes_in_view[x][y]
+
+    def criminals_near(self, pos):
+        """The economic agents within vision of pos that committed a crime this turn."""
+        if self.count_crimes_near(pos) == 0:
+            return []
+        criminals = self.criminals
+        return [agent for x, y in self.vision(pos) for agent in criminals[x][y]]
+
+    def economic_agents_near(self, pos):
+        """All economic agents within vision of pos, arrested or not."""
+        econ = self.econ
+        return [agent for x, y in self.vision(pos) for agent in econ[x][y]]
@@ -0,0 +1,69 @@
+import itertools
+import numpy as np
+import pandas as pd
+from rng import run_seed
+from run_cache import config_id
+from experiment import run_tasks
+from snapshot import FORKABLE, burn_in_all
+
+def sweep(base, axes, repeats=40, steps=1000, outputs=('num_crimes_committed',), seed=0, n_jobs=-1, batch_size='auto', use_kernel=False,
+          cache=None, queue=None, burn_in=0):
+    """
+    Run a parameter sweep in parallel and return the final-step outputs of every run.
+
+    Every combination of the values of the axes (one axis, or the grid of two or more) is run repeats times
+    on top of the base parameters. The runs go through experiment.run_tasks, so they are spread over n_jobs
+    processes (or the workers of a task queue) in batches, and only keep their final step.
+
+    Parameters:
+    - base (dict): Model parameters shared by all runs.
+    - axes (dict): Parameter name -> values to sweep.
+    - repeats (int): Runs per combination.
+    - steps (int): Steps per run.
+    - outputs (list): Model reporters to return.
+    - seed (int or None): Base seed, see rng.run_seed; None gives different runs every time.
+    - n_jobs (int): Number of joblib processes, -1 uses every CPU.
+    - batch_size (int or str): Runs per joblib task, see experiment.batches_of.
+    - use_kernel (bool): Run KernelEconomicModel, see kernel.make_model.
+    - cache (RunCache or None): Cache of finished runs.
+    - queue (TaskQueue or None): Run on the workers of this task queue instead of joblib.
+    - burn_in (int): With axes in snapshot.FORKABLE only and a seed, every repeat runs the base parameters
+      for this many steps once and all combinations fork from it, see snapshot.fork.
+
+    Returns:
+    - pd.DataFrame: One row per run, with a column per axis, the repeat and the outputs.
+    """
+    names = list(axes)
+    points = [dict(zip(names, values)) for values in itertools.product(*(np.asarray(values).tolist() for values in axes.values()))]
+    params_list = [{**base, **point} for point in points]
+
+    starts = None
+    if burn_in and seed is not None and all(name in FORKABLE for name in names):
+        starts = burn_in_all(base, min(burn_in, steps), [run_seed(seed, config_id(base), i) for i in range(repeats)], 'results/burn_in', n_jobs, use_kernel,
+                             'final', 'never')
+    if starts is None:
+        tasks = [(p, params, i, run_seed(seed, config_id(params), i)) for p, params in enumerate(params_list) for i in range(repeats)]
+    else:
+        tasks = [(p, params, i, run_seed(seed, config_id(base), i), starts[i]) for p, params in enumerate(params_list) for i in range(repeats)]
+
+    results = run_tasks(tasks, batch_size, cache is not None and seed is not None, steps, False, repeats, use_kernel, 'final', 'never', None, cache,
+                        queue=queue, n_jobs=n_jobs)
+    rows = [{**points[p], 'repeat': i, **{output: last[output] for output in outputs}} for (p, i), (_, _, last) in sorted(results.items())]
+    return pd.DataFrame(rows, columns=[*names, 'repeat', *outputs])
+
+def summarize(results, outputs=None):
+    """
+    Mean, standard deviation and number of runs of the outputs of a sweep per combination of the axes.
+
+    Parameters:
+    - results (pd.DataFrame): The frame returned by sweep.
+    - outputs (list): Outputs to summarize, all of them by default.
+
+    Returns:
+    - pd.DataFrame: One row per combination, with <output>_mean, <output>_std and <output>_count columns.
+    """
+    axes = list(results.columns[:list(results.columns).index('repeat')])
+    outputs = outputs or list(results.columns[len(axes) + 1:])
+    summary = results.groupby(axes)[outputs].agg(['mean', 'std', 'count'])
+    summary.columns = [f'{output}_{stat}' for output, stat in summary.columns]
+    return summary.reset_index()
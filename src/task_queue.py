@@ -0,0 +1,247 @@
+import os
+import sys
+import time
+import glob
+import uuid
+import pickle
+import socket
+import argparse
+import importlib
+import threading
+import traceback
+import multiprocessing
+
+class TaskQueue:
+    """
+    Task queue in a shared directory, so sweeps can run on any number of worker processes and machines.
+
+    A coordinator puts tasks, pickled (function, args) pairs, as files in path/pending. Workers claim a task by
+    renaming its file into path/claimed, which only one of them can do, run it, and commit the pickled result
+    to path/done; a task that raises goes to path/failed with its traceback. While a task runs its worker
+    touches the claimed file every lease / 3 seconds. A claim that has not been touched for lease seconds
+    belongs to a worker that died and goes back to pending for another worker. Files are written to a
+    temporary file and renamed like in RunCache, so nothing half written is ever read.
+
+    Everything is plain files and renames, so the same queue works for several workers on one machine and, on
+    a shared filesystem, for workers on several nodes. The functions are pickled by reference, so workers need
+    src/ on their path: start them with `python src/task_queue.py worker <path>`.
+
+    Parameters:
+    - path (str): Directory of the queue, created if needed. Relative paths are resolved against the current
+      directory, so workers started elsewhere are handed the same queue.
+    - lease (float): Seconds after which a claim that was not renewed expires.
+    - workers (int): Number of local worker processes map starts, on top of any workers started separately,
+      e.g. on other nodes.
+    - poll (float): Seconds between looks at the queue.
+    """
+    def __init__(self, path, lease=600, workers=0, poll=0.5):
+        self.path = os.path.abspath(path)
+        self.lease = lease
+        self.workers = workers
+        self.poll = poll
+        for state in ('pending', 'claimed', 'done', 'failed'):
+            os.makedirs(os.path.join(self.path, state), exist_ok=True)
+
+    def _file(self, state, name):
+        return os.path.join(self.path, state, name + '.pkl')
+
+    def _names(self, state, prefix=''):
+        return sorted(os.path.basename(file)[:-4] for file in glob.glob(os.path.join(self.path, state, prefix + '*.pkl')))
+
+    def _write(self, state, name, value):
+        file = self._file(state, name)
+        tmp = f'{file}.{socket.gethostname()}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, file)
+
+    def put(self, name, function, *args):
+        """Queue the task function(*args) under name."""
+        self._write('pending', name, (function, args))
+
+    def requeue_expired(self):
+        """Put claims whose lease expired back to pending, returns their names."""
+        requeued = []
+        now = time.time()
+        for name in self._names('claimed'):
+            try:
+                if now - os.path.getmtime(self._file('claimed', name)) > self.lease:
+                    os.rename(self._file('claimed', name), self._file('pending', name))
+                    requeued.append(name)
+            except FileNotFoundError:
+                pass # finished or requeued by someone else meanwhile
+        return requeued
+
+    def claim(self):
+        """
+        Claim the next pending task. A task that cannot be unpickled (a truncated file, or a function that was
+        moved or renamed since it was queued) goes to failed with its traceback, and the next one is claimed.
+
+        Returns:
+        - tuple or None: (name, function, args) of the claimed task, None if nothing is pending.
+        """
+        self.requeue_expired()
+        for name in self._names('pending'):
+            pending = self._file('pending', name)
+            try:
+                # the lease starts now, renaming keeps the modification time
+                os.utime(pending)
+                os.rename(pending, self._file('claimed', name))
+            except FileNotFoundError:
+                continue # another worker was faster
+            try:
+                with open(self._file('claimed', name), 'rb') as f:
+                    function, args = pickle.load(f)
+            except Exception:
+                self.fail(name, traceback.format_exc())
+                continue
+            return name, function, args
+        return None
+
+    def renew(self, name):
+        """Extend the lease of a claimed task, returns False if the claim is gone."""
+        try:
+            os.utime(self._file('claimed', name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, name, result):
+        """Commit the result of a claimed task."""
+        self._write('done', name, result)
+        try:
+            os.remove(self._file('claimed', name))
+        except FileNotFoundError:
+            pass # the lease expired, whoever runs the task again commits the same result
+
+    def fail(self, name, error):
+        """Move a claimed task to failed, with the error (e.g. a traceback) as its result."""
+        self._write('failed', name, error)
+        try:
+            os.remove(self._file('claimed', name))
+        except FileNotFoundError:
+            pass
+
+    def counts(self, prefix=''):
+        """Number of tasks in every state."""
+        return {state: len(self._names(state, prefix)) for state in ('pending', 'claimed', 'done', 'failed')}
+
+    def clear(self, prefix=''):
+        """Delete all tasks (whose names start with prefix)."""
+        for state in ('pending', 'claimed', 'done', 'failed'):
+            for file in glob.glob(os.path.join(self.path, state, prefix + '*.pkl')):
+                try:
+                    os.remove(file)
+                except FileNotFoundError:
+                    pass
+
+    def map(self, function, arg_lists):
+        """
+        Run function(*args) for every args in arg_lists on the workers of the queue, like Parallel does.
+
+        Parameters:
+        - function: Module-level function, so it pickles by reference.
+        - arg_lists (list): Arguments of every task.
+
+        Returns:
+        - list: The results, in the order of arg_lists.
+        """
+        if function.__module__ == '__main__':
+            # functions of the script being run pickle as __main__.<name>, which workers started on their own cannot import
+            script = os.path.splitext(os.path.basename(sys.modules['__main__'].__file__))[0]
+            function = getattr(importlib.import_module(script), function.__name__)
+        # a prefix per call, so late results of an earlier call are never mistaken for results of this one
+        prefix = uuid.uuid4().hex[:12] + '-'
+        names = [f'{prefix}{i:08d}' for i in range(len(arg_lists))]
+        for name, args in zip(names, arg_lists):
+            self.put(name, function, *args)
+
+        processes = [multiprocessing.Process(target=work, args=(self.path, self.lease, self.poll), daemon=True) for _ in range(self.workers)]
+        for process in processes:
+            process.start()
+        try:
+            results = {}
+            while len(results) < len(names):
+                failed = self._names('failed', prefix)
+                if failed:
+                    with open(self._file('failed', failed[0]), 'rb') as f:
+                        raise RuntimeError(f"Task {failed[0]} failed:\n{pickle.load(f)}")
+                for name in self._names('done', prefix):
+                    if name not in results:
+                        with open(self._file('done', name), 'rb') as f:
+                            results[name] = pickle.load(f)
+                self.requeue_expired()
+                if len(results) < len(names):
+                    time.sleep(self.poll)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+            self.clear(prefix)
+        return [results[name] for name in names]
+
+def task_queue(settings):
+    """TaskQueue from a config.toml [queue] table, None if it is missing or not enabled."""
+    if not settings or not settings.get('enabled', False):
+        return None
+    return TaskQueue(**{key: value for key, value in settings.items() if key != 'enabled'})
+
+def _keep_claim(queue, name, stop):
+    while not stop.wait(queue.lease / 3):
+        if not queue.renew(name):
+            return
+
+def work(path, lease=600, poll=0.5, idle_timeout=None):
+    """
+    Worker loop: claim tasks from the queue in path, run them and commit their results.
+
+    Parameters:
+    - path (str): Directory of the queue.
+    - lease (float): Lease of the queue, see TaskQueue.
+    - poll (float): Seconds to wait when nothing is pending.
+    - idle_timeout (float or None): Stop after this many seconds without a task, None runs until killed.
+
+    Returns:
+    - int: Number of tasks run.
+    """
+    queue = TaskQueue(path, lease)
+    done = 0
+    idle_since = time.time()
+    while True:
+        task = queue.claim()
+        if task is None:
+            if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                return done
+            time.sleep(poll)
+            continue
+
+        name, function, args = task
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_keep_claim, args=(queue, name, stop), daemon=True)
+        heartbeat.start()
+        try:
+            result = function(*args)
+        except Exception:
+            queue.fail(name, traceback.format_exc())
+        else:
+            queue.complete(name, result)
+        finally:
+            stop.set()
+            heartbeat.join()
+        done += 1
+        idle_since = time.time()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run tasks from a task queue:")
+    parser.add_argument('command', choices=['worker', 'status'], help='worker: run tasks, status: count the tasks in every state.')
+    parser.add_argument('path', type=str, help='Directory of the queue.')
+    parser.add_argument('--lease', type=float, default=600, help='Seconds after which an unrenewed claim expires.')
+    parser.add_argument('--poll', type=float, default=0.5, help='Seconds between looks at an empty queue.')
+    parser.add_argument('--idle-timeout', type=float, help='Stop after this many seconds without a task.')
+
+    args = parser.parse_args()
+    if args.command == 'worker':
+        print(f"Ran {work(args.path, args.lease, args.poll, args.idle_timeout)} tasks")
+    else:
+        print(TaskQueue(args.path, args.lease).counts())
@@ -0,0 +1,528 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from model import EconomicModel
+from collection import CollectionPolicy
+from collections import deque
+
+# Moore neighbourhood offsets, economic agents never stay put while cops may
+MOVES = np.array([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)])
+COP_MOVES = np.vstack([MOVES, [(0, 0)]])
+VISION = np.vstack([[(0, 0)], MOVES]) # radius 1 including the centre cell
+
+AGENT_REPORTERS = ['wealth', 'num_been_crimed', 'trading_skill', 'risk_aversion', 'num_interactions', 'total_trading_gain',
+                   'starting_wealth', 'amount_arrested', 'total_stealing_gain', 'crimes_committed_agent']
+
+class QueueArray:
+    """
+    Fixed-capacity FIFO queues for a whole population, one row per agent.
+
+    Mirrors a deque(maxlen=capacity) per agent: appending to a full queue evicts the oldest value.
+    A running sum per row is kept so means are O(1) per agent.
+    """
+    def __init__(self, num_agents, capacity, initial=None):
+        self.capacity = capacity
+        self.values = np.zeros((num_agents, capacity))
+        self.head = np.zeros(num_agents, dtype=np.int64) # next write position
+        self.count = np.zeros(num_agents, dtype=np.int64)
+        self.total = np.zeros(num_agents)
+        if initial is not None:
+            self.append(np.arange(num_agents), initial)
+
+    def append(self, idx, values):
+        """Append values to the queues in idx, which must not contain duplicates."""
+        head = self.head[idx]
+        evicted = np.where(self.count[idx] == self.capacity, self.values[idx, head], 0.0)
+        self.values[idx, head] = values
+        self.total[idx] += values - evicted
+        self.head[idx] = (head + 1) % self.capacity
+        self.count[idx] = np.minimum(self.count[idx] + 1, self.capacity)
+
+    def append_repeated(self, idx, value, times):
+        """Append value times[k] times to queue idx[k], which must not contain duplicates."""
+        keep = times > 0
+        idx, times = idx[keep], np.minimum(times[keep], self.capacity)
+        if idx.size == 0:
+            return
+        offset = np.arange(times.max())
+        written = offset < times[:, None]
+        slots = (self.head[idx, None] + offset) % self.capacity
+        # a slot holds a value to evict once it is within count of the write position
+        occupied = written & (offset >= (self.capacity - self.count[idx])[:, None])
+        rows = np.broadcast_to(idx[:, None], slots.shape)
+        evicted = np.where(occupied, self.values[rows, slots], 0.0).sum(axis=1)
+        self.values[rows[written], slots[written]] = value
+        self.total[idx] += times*value - evicted
+        self.head[idx] = (self.head[idx] + times) % self.capacity
+        self.count[idx] = np.minimum(self.count[idx] + times, self.capacity)
+
+    def mean_of(self, idx):
+        """Mean of the queues in idx, 0 for empty queues."""
+        count = self.count[idx]
+        return np.divide(self.total[idx], count, out=np.zeros(idx.size), where=count > 0)
+
+    def mean(self):
+        return np.divide(self.total, self.count, out=np.zeros_like(self.total), where=self.count > 0)
+
+    def resync(self):
+        """Recompute the running sums to shed floating point drift."""
+        self.total = self.values.sum(axis=1)
+
+def vision_table(width, height):
+    """For every cell id (x*height + y) the ids of the cells in its radius-1 Moore neighbourhood on a torus."""
+    x, y = np.divmod(np.arange(width*height), height)
+    return ((x[:, None] + VISION[:, 0]) % width) * height + (y[:, None] + VISION[:, 1]) % height
+
+class ArrayDataCollector:
+    """
+    Drop-in for the mesa.DataCollector used by EconomicModel, reading straight from the model arrays.
+
+    Produces the same model columns and an agent frame indexed by (Step, AgentID) with the same columns.
+    Cops are not reported at agent level since the object model only records None for them.
+    Model and agent data are recorded according to their own CollectionPolicy, like PolicyDataCollector.
+    """
+    def __init__(self, model_policy='every', agent_policy='every'):
+        self.model_policy = CollectionPolicy.parse(model_policy)
+        self.agent_policy = CollectionPolicy.parse(agent_policy)
+        self.model_vars = {}
+        self._agent_records = {}
+        self._collections = 0
+
+    def collect(self, model):
+        self._collections += 1
+        if self.model_policy.due(self._collections):
+            for var, value in model.report().items():
+                self.model_vars.setdefault(var, deque(maxlen=self.model_policy.keep)).append(value)
+        if self.agent_policy.due(self._collections):
+            self._agent_records[model.steps] = np.column_stack([getattr(model, name) for name in AGENT_REPORTERS])
+            keep = self.agent_policy.keep
+            while keep is not None and len(self._agent_records) > keep:
+                del self._agent_records[next(iter(self._agent_records))]
+
+    def get_model_vars_dataframe(self):
+        return pd.DataFrame(self.model_vars)
+
+    def get_agent_vars_dataframe(self):
+        steps = list(self._agent_records)
+        if not steps:
+            return pd.DataFrame(columns=AGENT_REPORTERS)
+        num_agents = len(self._agent_records[steps[0]])
+        index = pd.MultiIndex.from_product([steps, range(num_agents)], names=['Step', 'AgentID'])
+        return pd.DataFrame(np.vstack(list(self._agent_records.values())), index=index, columns=AGENT_REPORTERS)
+
+class VectorizedEconomicModel:
+    def __init__(self, num_econ_agents, initial_cops=0, width=20, height=20, election_frequency = 70, sentence_length = 20, interaction_memory = 50, risk_aversion_std = 0.3, trading_skill_std = 0.3, tax_per_cop = 0.01, seed=None, collect_model='every', collect_agents='every'):
+        """
+        Initialize a struct-of-arrays version of EconomicModel.
+
+        Takes the same parameters as EconomicModel (plus an optional seed) and reports the same
+        DataCollector columns. Agent state lives in NumPy arrays indexed by agent id and every phase of
+        EconomicAgent.step/CopAgent.step runs as one batched operation over the population:
+        all free agents move, pick a partner in their cell, decide, then trades and thefts are applied,
+        crimes are witnessed, cops move and arrest, taxes are paid and (on election steps) votes are cast.
+
+        Trades and thefts are applied in random order in rounds where no agent appears twice, and the
+        odds that a cop or witness sees a crime before or after the criminal's next activation are
+        reproduced by splitting them into an early and a late half each step. The outputs are
+        statistically, not path-wise, equivalent to EconomicModel; see equivalence_check.
+
+        Parameters:
+        - seed (int, optional): Seed for the model's numpy.random.Generator.
+        - collect_model (str): Collection policy of the model reporters, see collection.CollectionPolicy.
+        - collect_agents (str): Collection policy of the agent reporters, see collection.CollectionPolicy.
+        """
+        self.num_agents = num_econ_agents
+        self.num_cops = int(initial_cops)
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+
+        #parameters
+        self.sentence_length = sentence_length
+        self.prosperity = 0.05
+        self.tax_rate = initial_cops*tax_per_cop
+        self.election_frequency = election_frequency
+        self.interaction_memory = interaction_memory
+        self.risk_aversion_std = risk_aversion_std
+        self.tax_per_cop = tax_per_cop
+
+        #vars
+        self.votes = 0
+
+        #counters for data collection
+        self.num_crimes_committed = 0
+        self.num_arrests_made = 0
+        self.total_stolen = 0
+        self.total_trade_income = 0
+        self.steps = 0
+        self.total_tax_paid = 0
+
+        # economic agents, drawn in the same way as EconomicModel/EconomicAgent
+        n = self.num_agents
+        self.trading_skill = np.maximum(self.rng.normal(1, trading_skill_std, n), 0.1)
+        self.starting_wealth = self.rng.uniform(1, 10, n)
+        self.wealth = self.starting_wealth.copy()
+        risk_av = self.rng.normal(1, risk_aversion_std, n)
+        self.risk_aversion = np.where(risk_av <= 0, 0.1, risk_av)
+        self.x = self.rng.integers(0, width, n)
+        self.y = self.rng.integers(0, height, n)
+        self.vision = vision_table(width, height)
+
+        self.num_interactions = np.zeros(n, dtype=np.int64)
+        self.num_crimes_witnessed = np.zeros(n, dtype=np.int64)
+        self.num_punishments_witnessed = np.zeros(n, dtype=np.int64)
+        self.num_been_crimed = np.zeros(n, dtype=np.int64)
+        self.total_trading_gain = np.zeros(n)
+        self.total_stealing_gain = np.zeros(n)
+        self.crimes_committed_agent = np.zeros(n, dtype=np.int64)
+        self.amount_arrested = np.zeros(n, dtype=np.int64)
+
+        self.q_incomes = QueueArray(n, interaction_memory, initial=0)
+        self.q_crime_perception = QueueArray(n, interaction_memory)
+        self.q_interactions = QueueArray(n, interaction_memory)
+
+        self.has_traded_this_turn = np.zeros(n, dtype=bool)
+        self.has_committed_crime_this_turn = np.zeros(n, dtype=bool)
+        self.is_arrested = np.zeros(n, dtype=bool)
+        self.time_until_released = np.zeros(n, dtype=np.int64)
+
+        # cops, kept in creation order so elections remove the oldest one like EconomicModel does
+        self.cop_x = self.rng.integers(0, width, self.num_cops)
+        self.cop_y = self.rng.integers(0, height, self.num_cops)
+
+        self.datacollector = ArrayDataCollector(collect_model, collect_agents)
+
+    def report(self):
+        """Model-level values for the DataCollector, keyed like EconomicModel's model_reporters."""
+        return {
+            'Step': self.steps,
+            'num_cops': self.num_cops,
+            'num_crimes_committed': self.num_crimes_committed,
+            'num_arrests_made': self.num_arrests_made,
+            'tax_rate': self.tax_rate,
+            'total_stolen': self.total_stolen,
+            'total_trade_income': self.total_trade_income,
+            'avg_wealth': self.wealth.mean(),
+            'total_wealth': self.wealth.sum(),
+            'avg_crime_perception': self.q_crime_perception.mean().mean(),
+            'vote_outcome': self.votes,
+            'gini_coeff': self.gini()
+        }
+
+    def gini(self):
+        """Gini coefficient of agent wealth, same formula as model.compute_gini."""
+        x = np.sort(self.wealth)
+        N = self.num_agents
+        B = np.sum(x * (N - np.arange(N))) / (N * x.sum())
+        return 1 + (1 / N) - 2 * B
+
+    def move(self, active):
+        """Move the active economic agents to a random neighbouring cell."""
+        d = self.rng.integers(0, len(MOVES), active.size)
+        self.x[active] = (self.x[active] + MOVES[d, 0]) % self.width
+        self.y[active] = (self.y[active] + MOVES[d, 1]) % self.height
+
+    def choose_partners(self, active):
+        """
+        Pick a random free cellmate (other than itself) for every active agent.
+
+        Returns the initiators that found a partner and their partners.
+        """
+        cell = self.cell
+        candidates = np.flatnonzero(~self.is_arrested)
+        order = candidates[np.argsort(cell[candidates], kind='stable')]
+        sorted_cells = cell[order]
+        position = np.empty(self.num_agents, dtype=np.int64)
+        position[order] = np.arange(order.size)
+
+        start = np.searchsorted(sorted_cells, cell[active], 'left')
+        size = np.searchsorted(sorted_cells, cell[active], 'right') - start
+        found = size > 1
+        initiators, start, size = active[found], start[found], size[found]
+        pick = start + (self.rng.random(initiators.size) * (size - 1)).astype(np.int64)
+        # skip over the initiator itself
+        pick += pick >= position[initiators]
+        return initiators, order[pick]
+
+    def decide_action(self, agents, others):
+        """Vectorized EconomicAgent.decide_action, returns True where the agent steals."""
+        arrest_chance = self.q_crime_perception.mean_of(agents)
+        alpha = -1.2 # shape parameter for the pareto distribution
+        sp = 1 # scale parameter for the pareto distribution
+        transformed_sentence_length = sp / (self.sentence_length ** (1 / alpha))
+        expected_punishment_pain = self.wealth[agents] + self.risk_aversion[agents] * (transformed_sentence_length * self.q_incomes.mean_of(agents))
+
+        theft_EU = self.wealth[others]/2 - expected_punishment_pain*arrest_chance
+        trade_EU = (self.wealth[others] + self.wealth[agents]) * self.prosperity * self.trading_skill[agents]
+        return trade_EU < theft_EU
+
+    def interact(self, agents, others):
+        """
+        Let every initiator in agents decide on and carry out a trade or theft with its partner in others.
+
+        Interactions are taken in a random order and applied in rounds in which no agent appears twice,
+        so wealth and income memories evolve as they would one activation at a time.
+        """
+        order = self.rng.permutation(agents.size)
+        agents, others = agents[order], others[order]
+        while agents.size:
+            ids = np.column_stack([agents, others]).ravel()
+            first = np.zeros(ids.size, dtype=bool)
+            first[np.unique(ids, return_index=True)[1]] = True
+            now = first[0::2] & first[1::2]
+            a, o = agents[now], others[now]
+            steals = self.decide_action(a, o)
+            self.make_trade(a[~steals], o[~steals])
+            self.steal(a[steals], o[steals])
+            agents, others = agents[~now], others[~now]
+
+    def make_trade(self, agents, others):
+        """Vectorized EconomicAgent.make_trade, no agent may appear twice."""
+        if agents.size == 0:
+            return
+        trade_value = (self.wealth[others] + self.wealth[agents]) * self.prosperity
+        self.wealth[others] += trade_value * self.trading_skill[others]
+        self.wealth[agents] += trade_value * self.trading_skill[agents]
+
+        self.total_trading_gain[agents] += trade_value * self.trading_skill[agents]
+        self.total_trading_gain[others] += trade_value * self.trading_skill[others]
+
+        self.num_interactions[agents] += 1
+        self.num_interactions[others] += 1
+        self.has_traded_this_turn[agents] = True
+        self.has_traded_this_turn[others] = True
+        self.q_interactions.append(others, 0)
+        self.q_incomes.append(agents, trade_value)
+        self.total_trade_income += 2*trade_value.sum()
+
+    def steal(self, agents, others):
+        """Vectorized EconomicAgent.steal, no agent may appear twice."""
+        if agents.size == 0:
+            return
+        theft_value = self.wealth[others]/2
+        self.wealth[agents] += theft_value
+        self.wealth[others] -= theft_value
+        self.total_stealing_gain[agents] += theft_value
+        self.crimes_committed_agent[agents] += 1
+        self.q_incomes.append(agents, theft_value)
+
+        # EconomicAgent.steal books every theft twice, keep the same accounting
+        self.total_stolen += 2*theft_value.sum()
+        self.num_crimes_committed += 2*agents.size
+
+        self.has_committed_crime_this_turn[agents] = True
+        self.num_been_crimed[others] += 1
+        self.num_interactions[agents] += 1
+        self.num_interactions[others] += 1
+        self.q_interactions.append(others, 1)
+
+    def crime_counts(self):
+        """Crime flags of this turn and the number of flagged agents per cell."""
+        flags = self.has_committed_crime_this_turn.copy()
+        return flags, np.bincount(self.cell[flags], minlength=self.width*self.height)
+
+    def check_for_crimes(self, active, crimes):
+        """
+        Every agent in active notes a 0 in its crime perception for each crime in its neighbourhood.
+
+        crimes is a (flags, counts) pair from crime_counts. An agent's own crime is left out since it
+        always notes it once, right after committing it.
+        """
+        flags, counts = crimes
+        if active.size == 0 or not flags.any():
+            return
+        witnessed = counts[self.vision[self.cell[active]]].sum(axis=1) - flags[active]
+        self.q_crime_perception.append_repeated(active, 0, witnessed)
+        self.num_crimes_witnessed[active] += witnessed
+
+    def move_cops(self, cops):
+        """Move the cops in the index array cops, staying put is allowed."""
+        if cops.size == 0:
+            return
+        d = self.rng.integers(0, len(COP_MOVES), cops.size)
+        self.cop_x[cops] = (self.cop_x[cops] + COP_MOVES[d, 0]) % self.width
+        self.cop_y[cops] = (self.cop_y[cops] + COP_MOVES[d, 1]) % self.height
+
+    def arrest(self, cops):
+        """
+        Vectorized CopAgent.look_for_crimes/arrest for the cops in the index array cops.
+
+        Every criminal within vision of one of these cops is arrested by one of them chosen at random,
+        and each arrest is announced to every economic agent within vision of the arresting cop.
+        """
+        num_cells = self.width*self.height
+        criminals = np.flatnonzero(self.has_committed_crime_this_turn)
+        if criminals.size == 0 or cops.size == 0:
+            return
+        cops_per_cell = np.bincount(self.cop_x[cops]*self.height + self.cop_y[cops], minlength=num_cells)
+        cells = self.vision[self.cell[criminals]]
+        watching = cops_per_cell[cells]
+        seen = watching.sum(axis=1) > 0
+        criminals, cells, watching = criminals[seen], cells[seen], watching[seen]
+        if criminals.size == 0:
+            return
+
+        # choose the arresting cop's cell with probability proportional to the cops in it
+        cumulative = watching.cumsum(axis=1)
+        draw = self.rng.random(criminals.size) * cumulative[:, -1]
+        chosen = (cumulative <= draw[:, None]).sum(axis=1)
+        arrests = np.bincount(cells[np.arange(criminals.size), chosen], minlength=num_cells)
+
+        self.wealth[criminals] = 1 # like CopAgent.arrest in agent.py
+        self.is_arrested[criminals] = True
+        self.time_until_released[criminals] = self.sentence_length
+        self.amount_arrested[criminals] += 1
+        self.has_committed_crime_this_turn[criminals] = False
+        self.num_arrests_made += criminals.size
+
+        # arrest announcements reach jailed agents as well
+        announcements = arrests[self.vision[self.cell]].sum(axis=1)
+        self.q_crime_perception.append_repeated(np.arange(self.num_agents), 1, announcements)
+
+    def pay_tax(self):
+        self.wealth -= self.wealth * self.tax_rate
+        self.total_tax_paid += (self.wealth * self.tax_rate).sum()
+
+    def vote(self):
+        """Vectorized EconomicAgent.vote, returns the summed votes."""
+        crime_rate = self.q_interactions.total/self.interaction_memory
+        theft_threat = crime_rate * self.wealth * self.risk_aversion * 0.5
+        tax_burden = self.wealth*self.tax_rate
+        return int(np.where(theft_threat > tax_burden, 1, -1).sum())
+
+    @property
+    def cell(self):
+        """Flat cell id of every economic agent."""
+        return self.x * self.height + self.y
+
+    @property
+    def num_cops_placed(self):
+        return self.cop_x.size
+
+    def step(self):
+        """
+        Execute one step of the model simulation, see EconomicModel.step.
+        """
+        self.steps += 1
+        # Under random activation a cop or a witness looks at a crime after the criminal in the step of
+        # the crime and/or before it in the next step, each with odds 1/2, and a witness looks after a
+        # cop that shares its half with odds 2/3. Every step the cops and witnesses are split into an
+        # early half, which sees the crimes left over from the previous step, and a late half, which
+        # sees the crimes of this step; criminals of the previous step have not moved yet.
+        cops = np.arange(self.num_cops_placed)
+        early_cops = self.rng.random(cops.size) < 0.5
+        previous_crimes = self.crime_counts()
+        self.move_cops(cops[early_cops])
+        self.arrest(cops[early_cops])
+        previous_crimes_left = self.crime_counts()
+
+        self.has_traded_this_turn[:] = False
+        self.has_committed_crime_this_turn[:] = False
+
+        #if they're in jail they don't do anything
+        jailed = self.is_arrested.copy()
+        self.time_until_released[jailed] -= 1
+        self.is_arrested[jailed & (self.time_until_released == 0)] = False
+        active = np.flatnonzero(~jailed)
+
+        self.move(active)
+        self.interact(*self.choose_partners(active))
+
+        # a criminal always sees its own crime, right after committing it
+        crimes = self.crime_counts()
+        criminals = np.flatnonzero(crimes[0])
+        self.q_crime_perception.append(criminals, 0)
+        self.num_crimes_witnessed[criminals] += 1
+        self.move_cops(cops[~early_cops])
+        self.arrest(cops[~early_cops])
+        crimes_left = self.crime_counts()
+
+        early_witnesses = self.rng.random(active.size) < 0.5
+        after_cops = self.rng.random(active.size) < 2/3
+        for early, after, counts in ((True, False, previous_crimes), (True, True, previous_crimes_left),
+                                     (False, False, crimes), (False, True, crimes_left)):
+            self.check_for_crimes(active[(early_witnesses == early) & (after_cops == after)], counts)
+
+        self.pay_tax()
+        if self.steps % self.election_frequency == 0:
+            self.votes += self.vote()
+
+        if self.steps % self.interaction_memory == 0:
+            for queue in (self.q_incomes, self.q_crime_perception, self.q_interactions):
+                queue.resync()
+
+        self.hold_election()
+        self.datacollector.collect(self)
+
+    def hold_election(self):
+        """Adjust the tax rate and the cops to the votes on election steps, see EconomicModel.step."""
+        if (self.steps - 1) % self.election_frequency == 0 and self.steps != 1:
+            if self.votes > 0:
+                self.tax_rate += self.tax_per_cop
+            elif self.tax_rate > 0:
+                self.tax_rate -= self.tax_per_cop
+
+            # Adjusting the number of cops to voting results
+            self.num_cops = int(self.tax_rate / self.tax_per_cop)
+            if self.num_cops_placed < self.num_cops:
+                self.cop_x = np.append(self.cop_x, self.rng.integers(0, self.width))
+                self.cop_y = np.append(self.cop_y, self.rng.integers(0, self.height))
+            elif self.num_cops_placed > self.num_cops and self.num_cops_placed > 0:
+                self.cop_x, self.cop_y = self.cop_x[1:], self.cop_y[1:]
+            # reset the votes
+            self.votes = 0
+
+def final_step_outputs(model_class, params, max_steps, replicates, outputs, seed=0):
+    """Run replicates of a model class and return the final-step model outputs as a DataFrame."""
+    rows = []
+    for r in range(replicates):
+        model = model_class(**params, seed=seed + r, collect_model='final', collect_agents='never')
+        for _ in range(max_steps):
+            model.step()
+        rows.append(model.datacollector.get_model_vars_dataframe().iloc[-1][outputs])
+    return pd.DataFrame(rows).reset_index(drop=True)
+
+def equivalence_check(params=None, max_steps=150, replicates=40, outputs=('num_crimes_committed', 'num_arrests_made', 'num_cops', 'gini_coeff'), margin=0.1, alpha=0.05, model_class=None):
+    """
+    Statistical equivalence test of VectorizedEconomicModel (or another array model) against the object-based EconomicModel.
+
+    Runs both models for the same parameters and, for each final-step output, applies a two one-sided
+    Welch t-test (TOST): the models are equivalent on an output when the difference of the means is
+    shown to lie within +/- margin times the mean of the object model.
+
+    Parameters:
+    - params (dict): EconomicModel parameters, defaults to a small, fast configuration.
+    - max_steps (int): Steps per run.
+    - replicates (int): Runs per model.
+    - outputs (tuple): Model reporters to compare.
+    - margin (float): Equivalence margin relative to the object model mean.
+    - alpha (float): Significance level of each one-sided test.
+    - model_class (type): The model to test, defaults to VectorizedEconomicModel.
+
+    Returns:
+    - pd.DataFrame: Per output, the mean of both models, the relative difference, the TOST p-value and whether it passed.
+    """
+    if model_class is None:
+        model_class = VectorizedEconomicModel
+    if params is None:
+        params = dict(num_econ_agents=100, initial_cops=5, width=10, height=10, election_frequency=20, sentence_length=15, interaction_memory=20)
+    outputs = list(outputs)
+    reference = final_step_outputs(EconomicModel, params, max_steps, replicates, outputs)
+    vectorized = final_step_outputs(model_class, params, max_steps, replicates, outputs)
+
+    rows = []
+    for output in outputs:
+        ref, vec = reference[output].astype(float), vectorized[output].astype(float)
+        delta = margin * abs(ref.mean())
+        p_lower = stats.ttest_ind(vec + delta, ref, equal_var=False, alternative='greater').pvalue
+        p_upper = stats.ttest_ind(vec - delta, ref, equal_var=False, alternative='less').pvalue
+        p_value = max(p_lower, p_upper)
+        rows.append({'output': output, 'object_mean': ref.mean(), 'model_mean': vec.mean(),
+                     'relative_difference': (vec.mean() - ref.mean()) / ref.mean(), 'p_value': p_value, 'passed': p_value < alpha})
+    return pd.DataFrame(rows)
+
+if __name__ == '__main__':
+    result = equivalence_check()
+    print(result.to_string(index=False))
+    if not result['passed'].all():
+        raise SystemExit('VectorizedEconomicModel is not statistically equivalent to EconomicModel')
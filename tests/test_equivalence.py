@@ -0,0 +1,10 @@
+import pytest
+from vectorized_model import VectorizedEconomicModel, equivalence_check
+from kernel import KernelEconomicModel
+
+# few, short runs keep this to a few seconds, so the margin is wider than the 10% of the full check
+# (python src/vectorized_model.py and python src/kernel.py); the seeds are fixed, so the result is too
+@pytest.mark.parametrize('model_class', [VectorizedEconomicModel, KernelEconomicModel])
+def test_equivalent_to_economic_model(model_class):
+    result = equivalence_check(max_steps=60, replicates=20, margin=0.25, model_class=model_class)
+    assert result['passed'].all(), result.to_string(index=False)
@@ -0,0 +1,41 @@
+import os
+import pytest
+import toml
+import pandas as pd
+import experiment
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.toml')
+
+def write_config(directory, collect_model, output_format='csv', adaptive=False):
+    # a sweep small enough to run in a few seconds on one process
+    config = toml.load(CONFIG)
+    config['simulation'].update(num_samples=2, num_iterations=2, max_steps=4, save_agent_data=False, n_jobs=1, cache_dir='', profile=False,
+                                burn_in=0, collect_model=collect_model, output_format=output_format)
+    config['adaptive']['enabled'] = adaptive
+    config['queue']['enabled'] = False
+    path = os.path.join(directory, 'config.toml')
+    with open(path, 'w') as f:
+        toml.dump(config, f)
+    os.makedirs(os.path.join(directory, 'results'), exist_ok=True)
+    return path
+
+@pytest.mark.parametrize('collect_model', ['every', 'every:2', 'final', 'window:2', 'never'])
+def test_collection_policies(tmp_path, monkeypatch, collect_model):
+    monkeypatch.chdir(tmp_path)
+    experiment.run(write_config(tmp_path, collect_model), 'tax_per_cop')
+    results = pd.read_csv('results/model_results.csv')
+    if collect_model == 'never':
+        assert len(results) == 0
+    else:
+        assert set(results['iteration']) == {1, 2}
+        assert results['Step'].max() == 4
+
+@pytest.mark.parametrize('output_format', ['shards', 'normalized'])
+def test_never_with_sinks(tmp_path, monkeypatch, output_format):
+    monkeypatch.chdir(tmp_path)
+    experiment.run(write_config(tmp_path, 'never', output_format), 'tax_per_cop')
+
+def test_adaptive_needs_final_step(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError):
+        experiment.run(write_config(tmp_path, 'never', adaptive=True), 'tax_per_cop')